@@ -6,12 +6,15 @@ from flask_jwt_extended import JWTManager
 
 from app.models import database, migrate
 from app.routes.api import api
+from app.util.stream import AssetRequest
+from app.util.ingest import schedule_reladder
 
 # import the routes
 from app.routes.user import Login, CustomerLogin, User, UserProjects, UserUpdatePassword
 from app.routes.token import Token, TokenRefresh
 from app.routes.project import Project, ProjectAssets, ProjectScenarios, ProjectTimelines, ProjectScenes, ProjectCreate, ProjectObjects, ProjectVideos
 from app.routes.asset import Asset
+from app.routes.upload import Upload, UploadCreate, UploadFinalize
 from app.routes.scene import Scene, SceneObjects, SceneActions, SceneMedia, SceneAnnotation, SceneAnnotationDelete, SceneAnnotations, SceneMeta
 from app.routes.scenario import Scenario, ScenarioScenes, ScenarioScenesDelete, ScenarioScenesConnect, ScenarioScenesLinkDelete, ScenarioMeta, ScenarioValidate
 from app.routes.annotation import AnnotationOptions, AnnotationOptionDelete
@@ -22,6 +25,9 @@ from app.routes.customer import Customers, Customer, CustomerDelete, CustomerCre
 app = Flask(__name__)
 app.config.from_pyfile("config.py")
 
+# spool uploaded files into the asset directory, see AssetRequest
+app.request_class = AssetRequest
+
 CORS(app, supports_credentials=True)
 
 database.init_app(app)
@@ -36,3 +42,9 @@ def add_claims_to_access_token(identity):
 blueprint = Blueprint("api", __name__, url_prefix="/api")
 api.init_app(blueprint)
 app.register_blueprint(blueprint)
+
+@app.cli.command("reladder")
+def reladder():
+    """Encodes the renditions existing videos miss after HLS_PROFILES changed"""
+    scheduled = schedule_reladder()
+    print(f"Scheduled {len(scheduled)} video(s) for re-laddering")
@@ -1,11 +1,82 @@
+import os
+import socket
 from os import environ
 
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 SQLALCHEMY_DATABASE_URI = environ.get("DATABASE_URI")
 RESTPLUS_VALIDATE = True
 ASSET_DIR = environ.get("ASSET_DIR")
+UPLOAD_MAX_SIZE = int(environ.get("UPLOAD_MAX_SIZE", 5 * 1024 ** 3))  # bytes, matches client_max_body_size in nginx
+# transcode resumable uploads of videos that can be read in order while they
+# are in progress, once the first UPLOAD_STREAM_HEADER_SIZE bytes arrived; the
+# transcode fails if no data arrives for UPLOAD_STALL_TIMEOUT seconds
+UPLOAD_STREAMING = environ.get("UPLOAD_STREAMING", "1") == "1"
+UPLOAD_STREAM_HEADER_SIZE = int(environ.get("UPLOAD_STREAM_HEADER_SIZE", 8 * 1024 ** 2))
+UPLOAD_STALL_TIMEOUT = int(environ.get("UPLOAD_STALL_TIMEOUT", 30 * 60))
+UPLOAD_EXPIRY = int(environ.get("UPLOAD_EXPIRY", 2 * 24 * 60 * 60))  # seconds after its last chunk an unfinished upload is removed
 REDIS_URL = environ.get("REDIS_URL", "redis://redis:6379/0")
-QUEUES = environ.get("QUEUES", "default").split(",")
+# short jobs the editor waits for (probe, thumbnail), downloads of imports and
+# long transcodes are queued separately, a worker takes jobs from the queues
+# it listens to in order. Imports are only transcoded while they download if
+# another worker than the downloading one listens to the bulk queue.
+INTERACTIVE_QUEUE = environ.get("INTERACTIVE_QUEUE", "interactive")
+IMPORT_QUEUE = environ.get("IMPORT_QUEUE", "import")
+BULK_QUEUE = environ.get("BULK_QUEUE", "bulk")
+QUEUES = environ.get("QUEUES", f"{INTERACTIVE_QUEUE},{IMPORT_QUEUE},{BULK_QUEUE}").split(",")
+JOB_TIMEOUT = int(environ.get("JOB_TIMEOUT", 6 * 60 * 60))  # seconds a media job may run
+# Resources of bulk media jobs, so transcodes do not slow down the API: at
+# most MAX_CONCURRENT_ENCODES run at the same time on a MEDIA_HOST (workers
+# on the same machine have to share the name; set it in Docker, where the
+# host name is the container ID), each on MEDIA_THREADS cores of its own
+# (0 for all) with as many encoder threads, at niceness MEDIA_NICE and in IO
+# class MEDIA_IO_CLASS ("best-effort", "idle" or "" to keep the default)
+MAX_CONCURRENT_ENCODES = int(environ.get("MAX_CONCURRENT_ENCODES", 1))
+# transcodes of uploads in progress are paced by the upload, they have slots
+# of their own so a slow upload does not hold up the other encodes
+MAX_CONCURRENT_STREAMS = int(environ.get("MAX_CONCURRENT_STREAMS", 2))
+MEDIA_HOST = environ.get("MEDIA_HOST", socket.gethostname())
+MEDIA_THREADS = int(environ.get("MEDIA_THREADS", max(1, (os.cpu_count() or 1) // MAX_CONCURRENT_ENCODES)))
+MEDIA_NICE = int(environ.get("MEDIA_NICE", 10))
+MEDIA_IO_CLASS = environ.get("MEDIA_IO_CLASS", "best-effort")
+# Segment-parallel transcoding: "" encodes in a single ffmpeg process, "pool"
+# encodes chunks of HLS_CHUNK_SECONDS in HLS_PARALLEL_WORKERS local processes
+# and "rq" enqueues every chunk as a job (ASSET_DIR must be shared by workers)
+HLS_PARALLEL = environ.get("HLS_PARALLEL", "")
+HLS_CHUNK_SECONDS = int(environ.get("HLS_CHUNK_SECONDS", 60))
+HLS_PARALLEL_WORKERS = int(environ.get("HLS_PARALLEL_WORKERS", MEDIA_THREADS or os.cpu_count() or 1))  # processes share the MEDIA_THREADS of the slot
+HLS_REMUX = environ.get("HLS_REMUX", "1") == "1"  # copy the source into the rendition it already matches
+# "mpegts" writes HLS with TS segments, "fmp4" writes CMAF segments that are
+# described by both an HLS playlist and a DASH manifest (main.mpd)
+HLS_SEGMENT_TYPE = environ.get("HLS_SEGMENT_TYPE", "mpegts")
+# tiled streaming for viewport adaptive players, e.g. "4x2" for a grid of 4
+# columns and 2 rows; the tiles are written next to the regular stream
+HLS_TILES = environ.get("HLS_TILES", "")
+# projection videos are transcoded to unless chosen per asset: equirectangular,
+# cubemap or eac (equi-angular cubemap), see app.util.ffmpeg.PROJECTIONS
+HLS_PROJECTION = environ.get("HLS_PROJECTION", "equirectangular")
+TRICKPLAY_INTERVAL = int(environ.get("TRICKPLAY_INTERVAL", 2))  # seconds between scrubbing thumbnails, 0 disables them
+REPLACED_STREAM_TTL = int(environ.get("REPLACED_STREAM_TTL", 24 * 60 * 60))  # seconds a stream that was segmented again is kept for players that loaded it
+THUMBNAIL_CACHE_SIZE = int(environ.get("THUMBNAIL_CACHE_SIZE", 512 * 1024 ** 2))  # bytes of generated thumbnail variants kept on disk
+# durations (seconds) of the first segments of every stream, short segments
+# start playback faster, e.g. "1,2". Opt-in: planned segments place keyframes
+# at the segment boundaries only and rule out copying the source into a
+# rendition (HLS_REMUX). Empty (the default) for regular segments only.
+HLS_INITIAL_SEGMENTS = [int(seconds) for seconds in environ.get("HLS_INITIAL_SEGMENTS", "").split(",") if seconds]
+# single pass transcodes publish the lowest rendition before the others.
+# Opt-in: the source is decoded twice, once for the lowest rendition and once
+# for the others, which costs more CPU than a single pass over the ladder
+HLS_PROGRESSIVE = environ.get("HLS_PROGRESSIVE", "0") == "1"
+# codecs the renditions are encoded with when HLS_SEGMENT_TYPE is "fmp4", e.g.
+# "h264,hevc,av1"; see app.util.ffmpeg.VIDEO_CODECS. TS segments are always H.264
+HLS_CODECS = [codec for codec in environ.get("HLS_CODECS", "h264").split(",") if codec]
+# trial-encode samples of every video to lower the bitrates of calm content.
+# Off by default: the trial encodes and quality measurements of every rung
+# run before the transcode, so they delay the first playable rendition
+PER_TITLE_ENCODING = environ.get("PER_TITLE_ENCODING", "0") == "1"
+# seconds a progress event stream waits for the next report; the API runs in
+# synchronous uwsgi processes, so the stream is long-polling and the editor
+# polls the progress endpoint instead
+PROGRESS_STREAM_TIMEOUT = int(environ.get("PROGRESS_STREAM_TIMEOUT", 5))
 JWT_SECRET_KEY = environ.get("JWT_SECRET_KEY")
 JWT_IDENTITY_CLAIM = 'sub'
 JWT_ACCESS_COOKIE_PATH = "/api/"
@@ -11,6 +11,16 @@ class ViewType(enum.Enum):
     sidetoside = 1
     toptobottom = 2
 
+class Projection(enum.Enum):
+    equirectangular = 0
+    cubemap = 1
+    eac = 2
+
+class AssetStatus(enum.Enum):
+    processing = 0
+    ready = 1
+    failed = 2
+
 from app.models.database import db
 from sqlalchemy.dialects.postgresql import UUID
 
@@ -21,13 +31,33 @@ class Asset(db.Model):
     # Asset metadata
     name = db.Column(db.String(128))
     path = db.Column(db.String(128))
+    dash_path = db.Column(db.String(128)) # DASH manifest over the same segments, fmp4 output only
+    tiles_path = db.Column(db.String(128)) # tile manifest for viewport adaptive streaming, see create_tiles
     thumbnail_path = db.Column(db.String(128))
+    trickplay_path = db.Column(db.String(128)) # WebVTT index of the scrubbing sprite sheets
+    source_path = db.Column(db.String(128)) # uploaded file the stream is transcoded from
 
     duration = db.Column(db.Integer)
-    file_size = db.Column(db.Integer)
+    file_size = db.Column(db.BigInteger)
+    content_hash = db.Column(db.String(64), index=True) # SHA-256 of the uploaded file, uploads with the same content share the asset
+
+    # result of probing the source, see app.util.ffmpeg.probe
+    media_info = db.Column(db.JSON)
+
+    # HLS renditions that were produced for the video, see ladder_to_renditions
+    renditions = db.Column(db.JSON)
+
+    # annotation timestamps (seconds) the segments of the stream start at
+    cue_points = db.Column(db.JSON)
 
     asset_type = db.Column(db.Enum(AssetType), nullable=False)
     view_type = db.Column(db.Enum(ViewType), nullable=False, default=ViewType.mono)
+    projection = db.Column(db.Enum(Projection, name='projection'), nullable=False, default=Projection.equirectangular) # projection of the transcoded stream
+    source_projection = db.Column(db.String(32)) # projection of the uploaded file, see app.util.ffmpeg.SOURCE_PROJECTIONS
+
+    # processing state, videos only become playable once their job is done
+    status = db.Column(db.Enum(AssetStatus, name='asset_status'), nullable=False, default=AssetStatus.ready)
+    job_id = db.Column(db.String(64))
 
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now,
@@ -0,0 +1,35 @@
+import uuid
+from datetime import datetime
+
+from app.models.database import db
+from sqlalchemy.dialects.postgresql import UUID
+
+from app.util.util import missing_ranges
+
+class Upload(db.Model):
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, unique=True, nullable=False)
+    user_id = db.Column(UUID(as_uuid=True), db.ForeignKey("user.id"), unique=False, nullable=False) # UUID of user that started the upload
+    project_id = db.Column(UUID(as_uuid=True), db.ForeignKey("project.id", ondelete="CASCADE"), unique=False, nullable=False) # UUID of the project the asset is created in
+
+    # upload metadata
+    name = db.Column(db.String(128))
+    file_name = db.Column(db.String(128), nullable=False) # name of the file in the asset directory once finalized
+    size = db.Column(db.BigInteger, nullable=False)
+    projection = db.Column(db.String(32)) # projection to transcode the video to, the default if empty
+    source_projection = db.Column(db.String(32)) # projection of the uploaded video, detected if empty
+    asset_id = db.Column(UUID(as_uuid=True), db.ForeignKey("asset.id", ondelete="SET NULL")) # asset of a video that is transcoded while it is uploaded
+    failed = db.Column(db.Boolean, nullable=False, default=False) # the finalized upload could not be turned into an asset
+
+    # sorted list of half-open [start, end) byte ranges that have been received
+    received = db.Column(db.JSON, nullable=False, default=list)
+
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
+
+    @property
+    def missing(self):
+        return missing_ranges(self.received, self.size)
+
+    @property
+    def complete(self):
+        return len(self.missing) == 0
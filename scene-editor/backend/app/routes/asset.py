@@ -1,9 +1,10 @@
+import json
 from functools import wraps
 from pathlib import Path
 
-from flask_restx import Resource
+from flask_restx import Resource, reqparse
 from http import HTTPStatus
-from flask import send_file, make_response, jsonify
+from flask import Response, request, send_file, make_response, jsonify
 
 from app.models.database import db
 
@@ -14,14 +15,30 @@ from app.config import ASSET_DIR
 
 from app.routes.api import api
 
-from app.schemas.asset import asset_schema
+from app.util.jobs import job_status, get_progress, progress_events
+from app.util.thumbnails import THUMBNAIL_FORMATS, supported_formats, thumbnail_width, negotiate_format, cached_thumbnail
+
+from app.schemas.asset import asset_schema, asset_job_schema, asset_progress_schema
 
 from app.models.asset import Asset as AssetModel
-from app.models.asset import ViewType
+from app.models.asset import ViewType, AssetStatus
 from app.models.project import Project as ProjectModel
 
 ns = api.namespace("asset")
 
+# state reported for an asset of which the job is no longer known to redis
+JOB_STATE = {AssetStatus.processing: "queued", AssetStatus.ready: "done", AssetStatus.failed: "failed"}
+
+# thumbnails of an asset only change when it is processed again
+THUMBNAIL_MAX_AGE = 30 * 24 * 60 * 60
+
+thumbnail_args = reqparse.RequestParser()
+thumbnail_args.add_argument("width", type=int, location="args", help="Width in pixels, rounded up to a supported size")
+thumbnail_args.add_argument("format", type=str, location="args", choices=supported_formats(), help="Image format, negotiated from the Accept header if omitted")
+
+delete_args = reqparse.RequestParser()
+delete_args.add_argument("project_id", type=str, location="args", help="Project the asset is removed from, it is only deleted when no other project uses it")
+
 
 def project_access_required(fn):
     @wraps(fn)
@@ -60,13 +77,100 @@ class Thumbnail(Resource):
 
     @user_jwt_required
     @project_access_required
+    @ns.expect(thumbnail_args)
+    def get(self, id):
+        """
+        Returns the asset's thumbnail. With a width or format, a variant of
+        that size and format is generated on first request and cached.
+        """
+        asset = AssetModel.query.filter_by(id=id.split('.')[0]).first_or_404()
+
+        if asset.thumbnail_path is None:
+            return "Thumbnail not available", HTTPStatus.NOT_FOUND
+
+        args = thumbnail_args.parse_args()
+        if args["width"] is None and args["format"] is None:
+            return send_file(Path(ASSET_DIR, asset.thumbnail_path), as_attachment=True)
+
+        fmt = args["format"] or negotiate_format(request.accept_mimetypes)
+        width = thumbnail_width(args["width"] or 500)
+
+        response = send_file(cached_thumbnail(asset, width, fmt), mimetype=THUMBNAIL_FORMATS[fmt][0], max_age=THUMBNAIL_MAX_AGE)
+        # thumbnails are only served to logged in users
+        response.cache_control.public = False
+        response.cache_control.private = True
+        if args["format"] is None:
+            response.vary.add("Accept")
+        return response
+
+
+@ns.route("/<string:id>/job")
+@ns.response(HTTPStatus.NOT_FOUND, "Asset not found")
+@ns.param("id", "The asset identifier")
+class AssetJob(Resource):
+
+    @user_jwt_required
+    @project_access_required
+    @ns.marshal_with(asset_job_schema)
+    def get(self, id):
+        """
+        Reports the status of the job that processes the asset
+        """
+        asset = AssetModel.query.filter_by(id=id.split('.')[0]).first_or_404()
+
+        status = job_status(asset.job_id)
+
+        # finished jobs expire from redis, fall back to the state of the asset
+        if status is None:
+            status = JOB_STATE[asset.status]
+
+        return {"id": asset.id, "job_id": asset.job_id, "status": status, "asset_status": asset.status.name}
+
+
+@ns.route("/<string:id>/progress")
+@ns.response(HTTPStatus.NOT_FOUND, "Asset not found")
+@ns.param("id", "The asset identifier")
+class AssetProgress(Resource):
+
+    @user_jwt_required
+    @project_access_required
+    @ns.marshal_with(asset_progress_schema)
     def get(self, id):
         """
-        Fetches the asset's thumbnail location from database and returns it as a file
+        Returns the latest transcoding progress of the asset
         """
         asset = AssetModel.query.filter_by(id=id.split('.')[0]).first_or_404()
 
-        return send_file(Path(ASSET_DIR, asset.thumbnail_path), as_attachment=True)
+        report = get_progress(asset.id)
+
+        # no (recent) progress known, report the state of the asset instead
+        if report is None:
+            report = {"state": JOB_STATE[asset.status]}
+
+        return report
+
+
+@ns.route("/<string:id>/progress/stream")
+@ns.response(HTTPStatus.NOT_FOUND, "Asset not found")
+@ns.param("id", "The asset identifier")
+class AssetProgressStream(Resource):
+
+    @user_jwt_required
+    @project_access_required
+    def get(self, id):
+        """
+        Streams the transcoding progress of the asset as server-sent events.
+        The stream closes after the next report or a few seconds, the
+        EventSource then reconnects. Clients that poll use the progress
+        endpoint instead.
+        """
+        asset = AssetModel.query.filter_by(id=id.split('.')[0]).first_or_404()
+
+        if asset.status != AssetStatus.processing:
+            return Response(f"data: {json.dumps({'state': JOB_STATE[asset.status]})}\n\n", mimetype="text/event-stream")
+
+        return Response(progress_events(asset.id), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @ns.route("/<string:id>/delete")
@@ -76,12 +180,20 @@ class Thumbnail(Resource):
 
     @user_jwt_required
     @project_access_required
+    @ns.expect(delete_args)
     def post(self, id):
         """
         Deletes the assets with the given ids
         """
         asset = AssetModel.query.filter_by(id=id.split('.')[0]).first_or_404()
 
+        # uploads of the same file share the asset between projects
+        project_id = delete_args.parse_args()["project_id"]
+        if project_id is not None and len(asset.projects) > 1:
+            asset.projects = [project for project in asset.projects if str(project.id) != project_id]
+            db.session.commit()
+            return "", HTTPStatus.OK
+
         db.session.delete(asset)
         db.session.commit()
 
@@ -1,5 +1,6 @@
 import os
 from pathlib import Path
+from urllib.parse import urlparse
 
 from flask import request
 from flask_restx import Resource, reqparse
@@ -14,18 +15,19 @@ from app.routes.api import api
 from app.models.database import db
 
 from app.schemas.project import project_schema, project_create_schema
-from app.schemas.asset import asset_schema
+from app.schemas.asset import asset_schema, asset_import_schema
 from app.schemas.scene import scene_schema, scene_create_schema
 from app.schemas.scenario import scenario_overview_schema, scenario_create_schema
 from app.schemas.timeline import timeline_schema, timeline_create_schema
 
 from app.models.project import Project as ProjectModel
-from app.models.asset import Asset as AssetModel, AssetType
+from app.models.asset import AssetType, AssetStatus
 from app.models.scene import Scene as SceneModel
 from app.models.scenario import Scenario as ScenarioModel
 from app.models.timeline import Timeline as TimelineModel, TimelineScenario as TimelineScenarioModel
 
-from app.util.ffmpeg import create_thumbnail, get_duration, create_hls
+from app.util.ingest import extension_to_type, create_asset, import_asset
+from app.util.stream import store_upload, check_public_url
 import app.util.util as util
 from app.config import ASSET_DIR
 
@@ -59,32 +61,13 @@ class Project(Resource):
 asset_upload = reqparse.RequestParser()
 asset_upload.add_argument("file", type=FileStorage, location="files", required=True, help="Asset file")
 asset_upload.add_argument("name", type=str, required=True, help="Name for the asset")
+asset_upload.add_argument("projection", type=str, choices=("equirectangular", "cubemap", "eac"), help="Projection to transcode a video to")
+asset_upload.add_argument("source_projection", type=str, choices=("equirectangular", "cubemap", "eac", "youtube", "fisheye"), help="Projection of the uploaded video, detected if omitted")
 @ns.route("/<string:id>/assets")
 @ns.response(HTTPStatus.NOT_FOUND, "Project not found")
 @ns.param("id", "The project identifier")
 class ProjectAssets(Resource):
 
-    def extension_to_type(self, extension):
-        try:
-            return {".mp4": AssetType.video, ".glb": AssetType.model}[extension]
-        except KeyError:
-            return None
-
-    def generate_asset_meta(self, asset_type: AssetType, base_filename: Path, input_path: Path):
-        size = os.path.getsize(input_path)
-
-        # only get duration and thumbnail if it is a video
-        if asset_type == AssetType.video:
-            thumbnail_path = Path(ASSET_DIR, base_filename + '.jpg')
-            if not create_thumbnail(input_path.as_posix(), thumbnail_path.as_posix()):
-                thumbnail_path = None
-
-            duration = get_duration(input_path)
-
-            return {"duration": duration, "thumbnail_path": thumbnail_path.name, "file_size": size}
-
-        return {"duration": None, "thumbnail_path": None, "file_size": size}
-
     @user_jwt_required
     @ns.marshal_with(asset_schema)
     def get(self, id):
@@ -103,35 +86,63 @@ class ProjectAssets(Resource):
         args = asset_upload.parse_args()
         file = args["file"]
         asset_name = args["name"]
+        projection = args["projection"]
+        source_projection = args["source_projection"]
 
         _, extension = os.path.splitext(file.filename)
-        asset_type = self.extension_to_type(extension)
+        asset_type = extension_to_type(extension)
 
         if not asset_type:
             return "Invalid extension", HTTPStatus.BAD_REQUEST
 
         if 'Content-Range' in request.headers:
-            return "Chunked uploads not supported", HTTPStatus.BAD_REQUEST
+            return "Chunked uploads are handled by the upload endpoints", HTTPStatus.BAD_REQUEST
 
         base_name = util.random_file_name()
         raw_video_path = Path(ASSET_DIR, base_name + extension)
-        with open(raw_video_path, 'wb') as dest_file:
-            dest_file.write(file.stream.read())
-
-        meta = self.generate_asset_meta(asset_type, base_name, raw_video_path)
-        assert meta['thumbnail_path']
+        _, content_hash = store_upload(file, raw_video_path)
 
-        hls_output_dir = Path(ASSET_DIR, base_name)
-        hls_output_dir.mkdir()
-        create_hls(raw_video_path, hls_output_dir)
-        hls_playlist = base_name + '/main.m3u8'
+        row = create_asset(project, asset_name, asset_type, base_name, raw_video_path, content_hash, projection, source_projection)
 
-        # Only commit to database if files were uploaded and transcoded successfully
-        row = AssetModel(name=asset_name, user_id=project.user_id, path=hls_playlist, asset_type=asset_type, thumbnail_path=meta['thumbnail_path'], duration=meta["duration"], file_size=meta["file_size"], projects=[project])
-        db.session.commit()
+        # videos are transcoded in the background
+        if row.status == AssetStatus.processing:
+            return row, HTTPStatus.ACCEPTED
 
         return row, HTTPStatus.CREATED
 
+@ns.route("/<string:id>/assets/import")
+@ns.response(HTTPStatus.NOT_FOUND, "Project not found")
+@ns.param("id", "The project identifier")
+class ProjectAssetImport(Resource):
+
+    @user_jwt_required
+    @ns.expect(asset_import_schema, validate=True)
+    @ns.marshal_with(asset_schema)
+    def post(self, id):
+        """
+        Creates an asset from a file on a web server. The worker downloads
+        the file, resuming if the connection drops, and processes it like an
+        upload.
+        """
+        claims = get_jwt()
+        project = ProjectModel.query.filter_by(id=id, user_id=claims['id']).first_or_404()
+
+        # the worker checks every connection again, the host may resolve differently by then
+        try:
+            check_public_url(api.payload['url'])
+        except ValueError:
+            return "Only HTTP(S) URLs of public hosts can be imported", HTTPStatus.BAD_REQUEST
+        url = urlparse(api.payload['url'])
+
+        _, extension = os.path.splitext(url.path)
+        if not extension_to_type(extension):
+            return "Invalid extension", HTTPStatus.BAD_REQUEST
+
+        row = import_asset(project, api.payload['name'], api.payload['url'], extension.lower(), api.payload.get('sha256'),
+                           api.payload.get('projection'), api.payload.get('source_projection'))
+
+        return row, HTTPStatus.ACCEPTED
+
 @ns.route("/<string:id>/objects")
 @ns.response(HTTPStatus.NOT_FOUND, "Project not found")
 @ns.param("id", "The project identifier")
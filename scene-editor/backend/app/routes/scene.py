@@ -27,6 +27,8 @@ from app.models.scene_object import SceneObject as SceneObjectModel
 from app.models.annotation import Annotation as AnnotationModel
 from app.models.project import Project as ProjectModel
 
+from app.util.ingest import schedule_resegment
+
 import hashlib, binascii, os
 import uuid
 import datetime
@@ -112,10 +114,12 @@ class SceneMedia(Resource):
     @ns.expect(scene_add_media_schema)
     def put(self, id):
         scene = SceneModel.query.filter_by(id=id).first_or_404()
+        previous_video_id = scene.video_id
 
         if api.payload['video_id'] is None:
             scene.video_id = api.payload['video_id']
             db.session.commit()
+            schedule_resegment(previous_video_id)
             return "", HTTPStatus.OK
 
         video = AssetModel.query.filter_by(id=api.payload['video_id'], asset_type=AssetType.video).first_or_404()
@@ -128,11 +132,15 @@ class SceneMedia(Resource):
 
         # if existing annotations have a timestamp that does not exist in the video, reset it
         for annotation in annotations:
-            if annotation.timestamp > video.duration:
+            if video.duration is not None and annotation.timestamp > video.duration:
                 annotation.timestamp = video.duration
 
         db.session.commit()
 
+        # the annotations of the scene now apply to another video
+        schedule_resegment(previous_video_id)
+        schedule_resegment(video.id)
+
         return scene, HTTPStatus.OK
 
 @ns.route("/<string:id>/annotations")
@@ -177,6 +185,7 @@ class SceneAnnotation(Resource):
 
         db.session.add(annotation)
         db.session.commit()
+        schedule_resegment(scene.video_id)
 
         return annotation, HTTPStatus.OK
 
@@ -192,6 +201,7 @@ class SceneAnnotation(Resource):
         annotation.type = api.payload["type"]
 
         db.session.commit()
+        schedule_resegment(SceneModel.query.filter_by(id=id).first_or_404().video_id)
 
         return annotation, HTTPStatus.OK
 
@@ -209,6 +219,7 @@ class SceneAnnotationDelete(Resource):
 
         db.session.delete(annotation)
         db.session.commit()
+        schedule_resegment(scene.video_id)
 
         return "", HTTPStatus.OK
 
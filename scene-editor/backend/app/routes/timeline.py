@@ -24,6 +24,7 @@ from app.models.action import Action as ActionModel, ActionType as ActionType
 from app.models.option import Option as OptionModel
 from app.models.project import Project as ProjectModel
 from app.models.annotation import Annotation as AnnotationModel
+from app.models.asset import Asset as AssetModel
 
 def project_access_required(fn):
     @wraps(fn)
@@ -318,10 +319,12 @@ class TimelineExport(Resource):
             scenes_ = []
 
             for (_, _, scenario_scene, scene) in scenes:
+                video = AssetModel.query.filter_by(id=scene.video_id).first() if scene.video_id else None
                 o = {
                     "id": scenario_scene.id,
                     "scene_id": scene.id,
                     "video": scene.video_id,
+                    "projection": video.projection.name if video is not None else None,
                     "annotations": self.annotations(scene.id, scenario_scene.id),
                     "links": self.links(scene.id, scenario.id)
                 }
@@ -0,0 +1,209 @@
+import os
+from pathlib import Path
+
+from flask import request, make_response, jsonify
+from flask_restx import Resource
+from http import HTTPStatus
+
+from functools import wraps
+
+from flask_jwt_extended import get_jwt
+
+from app.util.auth import user_jwt_required
+
+from app.routes.api import api
+
+from app.models.database import db
+
+from app.schemas.upload import upload_schema, upload_create_schema
+
+from app.models.upload import Upload as UploadModel
+from app.models.project import Project as ProjectModel
+
+from app.util.ingest import extension_to_type, expire_uploads, find_duplicate, link_asset, partial_path, stream_upload
+from app.util.jobs import enqueue, abort_upload
+import app.util.util as util
+from app.config import ASSET_DIR, UPLOAD_MAX_SIZE, INTERACTIVE_QUEUE
+
+ns = api.namespace("upload")
+
+
+def upload_access_required(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        claims = get_jwt()
+        upload = UploadModel.query.filter_by(id=kwargs['id']).first_or_404()
+
+        if str(upload.user_id) != claims['id']:
+            return make_response(jsonify(msg='No access to upload'), HTTPStatus.UNAUTHORIZED)
+        else:
+            return fn(*args, **kwargs)
+
+    return wrapper
+
+
+@ns.route("/")
+class UploadCreate(Resource):
+
+    @user_jwt_required
+    @ns.expect(upload_create_schema, validate=True)
+    @ns.marshal_with(upload_schema)
+    def post(self):
+        """
+        Starts a resumable upload. The file is sent afterwards in chunks of
+        arbitrary size, possibly in parallel, using PUT requests. A file the
+        user uploaded before is linked to the project right away, the
+        response is then a complete upload that refers to the asset.
+        Abandoned uploads are removed first.
+        """
+        expire_uploads()
+
+        claims = get_jwt()
+        project = ProjectModel.query.filter_by(id=api.payload['project_id'], user_id=claims['id']).first_or_404()
+
+        _, extension = os.path.splitext(api.payload['filename'])
+        if not extension_to_type(extension):
+            return "Invalid extension", HTTPStatus.BAD_REQUEST
+
+        size = api.payload['size']
+        if size <= 0 or size > UPLOAD_MAX_SIZE:
+            return "Invalid file size", HTTPStatus.BAD_REQUEST
+
+        if api.payload.get('sha256'):
+            duplicate = find_duplicate(project.user_id, api.payload['sha256'].lower(), extension_to_type(extension),
+                                       api.payload.get('projection'), api.payload.get('source_projection'))
+            if duplicate is not None:
+                link_asset(duplicate, project)
+                return {"project_id": project.id, "name": api.payload['name'], "size": size,
+                        "received": [[0, size]], "missing": [], "complete": True, "asset_id": duplicate.id}, HTTPStatus.OK
+
+        upload = UploadModel(user_id=project.user_id,
+                             project_id=project.id,
+                             name=api.payload['name'],
+                             file_name=util.random_file_name() + extension,
+                             size=size,
+                             projection=api.payload.get('projection'),
+                             source_projection=api.payload.get('source_projection'),
+                             received=[])
+
+        # reserve the file up front, so chunks can be written at any offset
+        with open(partial_path(upload), 'wb') as f:
+            f.truncate(size)
+
+        db.session.add(upload)
+        db.session.commit()
+
+        return upload, HTTPStatus.CREATED
+
+
+@ns.route("/<string:id>")
+@ns.response(HTTPStatus.NOT_FOUND, "Upload not found")
+@ns.param("id", "The upload identifier")
+class Upload(Resource):
+
+    @user_jwt_required
+    @upload_access_required
+    @ns.marshal_with(upload_schema)
+    def get(self, id):
+        """
+        Returns which byte ranges have been received, so an interrupted
+        upload can be resumed by sending only the missing ranges, and the
+        asset of a finalized upload, or whether it failed
+        """
+        return UploadModel.query.filter_by(id=id).first_or_404()
+
+    @user_jwt_required
+    @upload_access_required
+    @ns.marshal_with(upload_schema)
+    def put(self, id):
+        """
+        Writes a chunk of the file. The position of the chunk is given by the
+        `Content-Range: bytes <start>-<end>/<size>` header. Videos that can be
+        read in order are transcoded as soon as their start has arrived, the
+        upload then refers to the asset. Chunks can not be written once the
+        upload is finalized or its data has expired.
+        """
+        upload = UploadModel.query.filter_by(id=id).first_or_404()
+
+        if 'Content-Range' not in request.headers:
+            return "Content-Range header is required", HTTPStatus.BAD_REQUEST
+
+        chunk_range = util.parse_content_range(request.headers['Content-Range'])
+        if chunk_range is None or chunk_range[2] != upload.size:
+            return "Invalid Content-Range", HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE
+
+        start, end, _ = chunk_range
+        if request.content_length != end - start:
+            return "Content-Length does not match Content-Range", HTTPStatus.BAD_REQUEST
+
+        if Path(ASSET_DIR, upload.file_name).exists():
+            return "Upload is finalized", HTTPStatus.CONFLICT
+        if not partial_path(upload).exists():
+            return "Upload has expired", HTTPStatus.GONE
+
+        # release the connection while the chunk is streamed to disk
+        db.session.commit()
+
+        try:
+            written = util.write_chunk(request.stream, partial_path(upload), start, end - start)
+        except FileNotFoundError:
+            # finalized or expired while the chunk was sent
+            return "Upload is no longer in progress", HTTPStatus.CONFLICT
+        if written != end - start:
+            return "Incomplete chunk", HTTPStatus.BAD_REQUEST
+
+        # chunks may arrive in parallel, so lock the row while merging ranges
+        upload = UploadModel.query.filter_by(id=id).with_for_update().first_or_404()
+        upload.received = util.add_range(upload.received, start, end)
+        stream_upload(upload, ProjectModel.query.filter_by(id=upload.project_id).first_or_404())
+        db.session.commit()
+
+        return upload, HTTPStatus.OK
+
+    @user_jwt_required
+    @upload_access_required
+    def delete(self, id):
+        """
+        Aborts the upload and removes the received data. The transcode of a
+        video that started during the upload fails.
+        """
+        upload = UploadModel.query.filter_by(id=id).first_or_404()
+
+        abort_upload(upload.id)
+        partial_path(upload).unlink(missing_ok=True)
+        db.session.delete(upload)
+        db.session.commit()
+
+        return '', HTTPStatus.NO_CONTENT
+
+
+@ns.route("/<string:id>/finalize")
+@ns.response(HTTPStatus.NOT_FOUND, "Upload not found")
+@ns.param("id", "The upload identifier")
+class UploadFinalize(Resource):
+
+    @user_jwt_required
+    @upload_access_required
+    @ns.marshal_with(upload_schema)
+    def post(self, id):
+        """
+        Turns a completely received upload into an asset in the background.
+        The file is hashed first, a file the user uploaded before is linked
+        to the project instead. The upload refers to the asset once it is
+        there, or is marked as failed, see GET.
+        """
+        upload = UploadModel.query.filter_by(id=id).with_for_update().first_or_404()
+
+        if not upload.complete:
+            return "Upload is not complete", HTTPStatus.CONFLICT
+
+        # finalized before
+        if not partial_path(upload).exists():
+            return upload, HTTPStatus.ACCEPTED
+
+        partial_path(upload).rename(Path(ASSET_DIR, upload.file_name))
+        db.session.commit()
+
+        enqueue('app.tasks.finalize_upload', str(upload.id), queue=INTERACTIVE_QUEUE)
+
+        return upload, HTTPStatus.ACCEPTED
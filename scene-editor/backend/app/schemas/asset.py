@@ -2,15 +2,63 @@ from flask_restx import fields
 
 from app.routes.api import api
 
+rendition_schema = api.model("Rendition", {
+    "playlist": fields.String(description="Media playlist of the rendition, relative to the main playlist"),
+    "width": fields.Integer(description="Width of the rendition in pixels"),
+    "height": fields.Integer(description="Height of the rendition in pixels"),
+    "video_bitrate": fields.Integer(description="Video bitrate in kbit/s"),
+    "audio_bitrate": fields.Integer(description="Audio bitrate in kbit/s"),
+    "codec": fields.String(description="Video codec of the rendition: h264, hevc or av1"),
+})
+
 asset_schema = api.model("Asset", {
     "id": fields.String(description="ID of the asset"),
     "name": fields.String(description="Name of the asset"),
     "path": fields.String(description="Path of the asset on the server"),
+    "dash_path": fields.String(description="Path of the DASH manifest of a video asset, if it was packaged as CMAF"),
+    "tiles_path": fields.String(description="Path of the tile manifest of a video asset, if it was tiled for viewport adaptive streaming"),
     "thumbnail_path": fields.String(description="Path of the thumbnail of the asset on the server"),
+    "trickplay_path": fields.String(description="Path of the WebVTT track with the scrubbing thumbnails of a video asset, which refers to sprite sheets next to it"),
     "asset_type": fields.String(description="The type of asset, this can either be a video or a model"),
     "view_type": fields.String(description="The view type of the asset. States if the video is stereosopic"),
+    "projection": fields.String(description="Projection of the video stream: equirectangular, cubemap (3x2) or eac (equi-angular cubemap, 3x2)"),
+    "source_projection": fields.String(description="Projection of the uploaded video: equirectangular, cubemap, eac, youtube (YouTube's cubemap layout) or fisheye"),
+    "status": fields.String(description="Processing state of the asset: processing, ready or failed"),
     "file_size": fields.Integer(description="The size of the file"),
     "duration": fields.Integer(description="The duration of the asset"),
+    "media_info": fields.Raw(description="Metadata of the source video: duration in seconds, resolution, fps, codecs, bitrates, rotation, projection and stereo layout"),
+    "renditions": fields.List(fields.Nested(rendition_schema), description="The HLS renditions of a video asset"),
+    "cue_points": fields.List(fields.Integer, description="Annotation timestamps in seconds at which segments of the stream start"),
     "created_at": fields.Date(description="Date at which the asset was created"),
     "updated_at": fields.Date(description="Date at which the asset was last updated"),
 })
+
+asset_job_schema = api.model("Asset Job", {
+    "id": fields.String(description="ID of the asset"),
+    "job_id": fields.String(description="ID of the processing job"),
+    "status": fields.String(description="Status of the processing job: queued, running, failed or done"),
+    "asset_status": fields.String(description="Processing state of the asset: processing, ready or failed"),
+})
+
+asset_progress_schema = api.model("Asset Progress", {
+    "state": fields.String(description="queued, running, encoded, done or failed"),
+    "frame": fields.Integer(description="Number of frames encoded"),
+    "fps": fields.Float(description="Frames encoded per second"),
+    "speed": fields.Float(description="Encoding speed as a multiple of real time"),
+    "out_time": fields.Float(description="Seconds of video encoded"),
+    "duration": fields.Float(description="Duration of the video in seconds"),
+    "time_left": fields.Float(description="Estimated number of seconds until encoding is done"),
+    "chunks": fields.Integer(description="Number of chunks of a segment-parallel encode"),
+    "chunks_done": fields.Integer(description="Number of chunks that have been encoded"),
+    "playable": fields.Boolean(description="Sent once the first rendition of a video can be played, while the others are still encoded"),
+    "downloaded": fields.Integer(description="Number of bytes of an imported file that have been downloaded"),
+    "size": fields.Integer(description="Size of an imported file in bytes, if the server reports it"),
+})
+
+asset_import_schema = api.model("Asset Import", {
+    "url": fields.String(required=True, description="HTTP(S) URL of the file to import, its extension determines the asset type"),
+    "name": fields.String(required=True, description="Name for the asset"),
+    "sha256": fields.String(description="SHA-256 checksum the downloaded file has to match"),
+    "projection": fields.String(enum=["equirectangular", "cubemap", "eac"], description="Projection to transcode a video to, the server default if omitted"),
+    "source_projection": fields.String(enum=["equirectangular", "cubemap", "eac", "youtube", "fisheye"], description="Projection of the imported video, detected from its metadata if omitted"),
+})
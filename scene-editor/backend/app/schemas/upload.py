@@ -0,0 +1,27 @@
+from flask_restx import fields
+
+from app.routes.api import api
+
+upload_schema = api.model("Upload", {
+    "id": fields.String(description="ID of the upload"),
+    "project_id": fields.String(description="ID of the project the asset will be created in"),
+    "name": fields.String(description="Name for the asset"),
+    "size": fields.Integer(description="Total size of the file in bytes"),
+    "received": fields.List(fields.List(fields.Integer), description="Byte ranges [start, end) that have been received"),
+    "missing": fields.List(fields.List(fields.Integer), description="Byte ranges [start, end) that still have to be sent"),
+    "complete": fields.Boolean(description="Whether all bytes have been received"),
+    "asset_id": fields.String(description="ID of the asset of a video that is already transcoded while it is uploaded, of the asset a finalized upload was turned into, or of the existing asset with the same content"),
+    "failed": fields.Boolean(description="Whether the finalized upload could not be turned into an asset"),
+    "created_at": fields.Date(description="Date at which the upload was started"),
+    "updated_at": fields.Date(description="Date at which the last chunk was received"),
+})
+
+upload_create_schema = api.model("Upload Create", {
+    "project_id": fields.String(required=True, description="ID of the project to create the asset in"),
+    "name": fields.String(required=True, description="Name for the asset"),
+    "filename": fields.String(required=True, description="Original file name, used to determine the asset type"),
+    "size": fields.Integer(required=True, description="Total size of the file in bytes"),
+    "projection": fields.String(enum=["equirectangular", "cubemap", "eac"], description="Projection to transcode a video to, the server default if omitted"),
+    "source_projection": fields.String(enum=["equirectangular", "cubemap", "eac", "youtube", "fisheye"], description="Projection of the uploaded video, detected from its metadata if omitted"),
+    "sha256": fields.String(description="SHA-256 of the file. If the user uploaded it before, the existing asset is added to the project and nothing has to be sent"),
+})
@@ -0,0 +1,232 @@
+"""
+Jobs that are executed by the RQ worker (see `app/worker.py`). They run
+outside of a request, so each job sets up its own application context.
+Jobs that encode run in an encode slot of the host, see `encode_slot`, and
+transcodes of uploads in progress in a stream slot, see `stream_slot`.
+"""
+from pathlib import Path
+
+from app.app import app
+from app.models.database import db
+from app.models.asset import Asset as AssetModel, AssetType, AssetStatus
+from app.models.upload import Upload as UploadModel
+
+from app.util.ffmpeg import encode_chunk, chunk_times, chunk_keyframes
+from app.util.ingest import ingest_upload, download_source, inspect_video, prepare_video, process_video, stream_video, finish_streamed_video, split_video, stitch_video, resegment_video, needs_resegment, remove_replaced_stream, reladder_video, ladder_of, boundaries_of
+from app.util.jobs import connection, enqueue, encode_slot, stream_slot, publish_progress, abort_upload
+from app.config import HLS_PARALLEL, MEDIA_THREADS
+
+
+def fail(asset):
+    db.session.rollback()
+    asset.status = AssetStatus.failed
+    db.session.commit()
+    publish_progress(asset.id, {"state": "failed"})
+
+
+def finish(asset):
+    asset.status = AssetStatus.ready
+    db.session.commit()
+    publish_progress(asset.id, {"state": "done"})
+
+
+def inspect_asset(asset_id):
+    """
+    Probes the video and creates its thumbnail on the interactive queue, then
+    enqueues the transcode on the bulk queue
+    """
+    with app.app_context():
+        asset = AssetModel.query.filter_by(id=asset_id).first()
+
+        # the asset was deleted before the job started
+        if asset is None:
+            return
+
+        try:
+            inspect_video(asset)
+        except Exception:
+            fail(asset)
+            raise
+
+        asset.job_id = enqueue('app.tasks.process_asset', asset_id).id
+        db.session.commit()
+
+
+def finalize_upload(upload_id):
+    """
+    Hashes a completely received upload on the interactive queue, outside of
+    the API request, and turns it into an asset
+    """
+    with app.app_context():
+        upload = UploadModel.query.filter_by(id=upload_id).first()
+
+        # the upload expired before the job started
+        if upload is None:
+            return
+
+        try:
+            ingest_upload(upload)
+        except Exception:
+            # a video that was transcoded during the upload only lacks its hash
+            db.session.rollback()
+            if upload.asset_id is None:
+                upload.failed = True
+                # the asset may have been created before the failure
+                asset = AssetModel.query.filter_by(source_path=upload.file_name).first()
+                if asset is not None:
+                    upload.asset_id = asset.id
+                    fail(asset)
+                db.session.commit()
+            raise
+
+
+def import_asset(asset_id, url, sha256=None):
+    """
+    Downloads an imported file, which is then processed like an upload
+    """
+    with app.app_context():
+        asset = AssetModel.query.filter_by(id=asset_id).first()
+
+        if asset is None:
+            return
+
+        try:
+            download_source(asset, url, sha256, progress=lambda report: publish_progress(asset_id, report))
+        except Exception:
+            # a transcode that started during the download fails as well
+            abort_upload(asset_id)
+            fail(asset)
+            raise
+
+        if asset.asset_type != AssetType.video:
+            finish(asset)
+
+
+def process_asset(asset_id):
+    with app.app_context(), encode_slot():
+        asset = AssetModel.query.filter_by(id=asset_id).first()
+
+        # the asset was deleted before the job started
+        if asset is None:
+            return
+
+        try:
+            if HLS_PARALLEL == "rq":
+                distribute_asset(asset)
+                return
+
+            process_video(asset, progress=lambda report: publish_progress(asset_id, report))
+        except Exception:
+            fail(asset)
+            raise
+
+        finish(asset)
+
+
+def stream_asset(asset_id, upload_id):
+    with app.app_context():
+        asset = AssetModel.query.filter_by(id=asset_id).first()
+
+        if asset is None:
+            return
+
+        progress = lambda report: publish_progress(asset_id, report)
+        try:
+            # the transcode waits for the upload, the steps after it do not
+            with stream_slot():
+                stream_video(asset, upload_id, progress)
+            db.session.commit()
+            with encode_slot():
+                finish_streamed_video(asset, progress)
+        except Exception:
+            fail(asset)
+            raise
+
+        finish(asset)
+
+
+def distribute_asset(asset):
+    """
+    Splits the source of the asset and enqueues a job per chunk, followed by
+    a job that stitches the chunks once they are all encoded. The asset keeps
+    processing until the stitch job is done.
+    """
+    prepare_video(asset)
+    chunks = split_video(asset)
+    times = chunk_times(chunks[0].parent)
+    boundaries = boundaries_of(asset)
+
+    connection.delete(chunks_done_key(asset.id))
+    jobs = [enqueue('app.tasks.encode_asset_chunk', str(asset.id), chunk.as_posix(), len(chunks), ladder_of(asset), asset.projection.name, asset.source_projection,
+                    chunk_keyframes(boundaries, *times[chunk.name]))
+            for chunk in chunks]
+    stitch_job = enqueue('app.tasks.stitch_asset', str(asset.id), [chunk.as_posix() for chunk in chunks], depends_on=jobs)
+
+    asset.job_id = stitch_job.id
+    db.session.commit()
+
+
+def chunks_done_key(asset_id) -> str:
+    return f"asset:{asset_id}:chunks_done"
+
+
+def encode_asset_chunk(asset_id, chunk_path, chunks, profiles, projection="equirectangular", source_projection="equirectangular", keyframes=None):
+    with encode_slot():
+        encode_chunk(chunk_path, profiles, projection, source_projection, keyframes, MEDIA_THREADS)
+
+    done = connection.incr(chunks_done_key(asset_id))
+    publish_progress(asset_id, {"state": "running", "chunks": chunks, "chunks_done": done})
+
+
+def stitch_asset(asset_id, chunk_paths):
+    with app.app_context(), encode_slot():
+        asset = AssetModel.query.filter_by(id=asset_id).first()
+        connection.delete(chunks_done_key(asset_id))
+
+        if asset is None:
+            return
+
+        try:
+            stitch_video(asset, [Path(chunk) for chunk in chunk_paths], progress=lambda report: publish_progress(asset_id, report))
+        except Exception:
+            fail(asset)
+            raise
+
+        finish(asset)
+
+
+def resegment_asset(asset_id, previous_job_id=None):
+    with app.app_context():
+        asset = AssetModel.query.filter_by(id=asset_id).first()
+
+        # an earlier job may have segmented the video at the current timestamps
+        if asset is None or asset.status != AssetStatus.ready or not needs_resegment(asset):
+            return
+
+        # the current stream stays available, so a failure leaves the asset
+        # ready and its job the one that made that stream
+        try:
+            with encode_slot():
+                resegment_video(asset)
+        except Exception:
+            db.session.rollback()
+            asset.job_id = previous_job_id
+            db.session.commit()
+            raise
+        db.session.commit()
+
+
+def remove_stream(name):
+    remove_replaced_stream(name)
+
+
+def reladder_asset(asset_id):
+    with app.app_context(), encode_slot():
+        asset = AssetModel.query.filter_by(id=asset_id).first()
+
+        if asset is None or asset.status != AssetStatus.ready:
+            return
+
+        # the current renditions stay available until the new ladder is published
+        reladder_video(asset)
+        db.session.commit()
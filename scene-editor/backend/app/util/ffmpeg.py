@@ -1,13 +1,22 @@
+import os
+import re
+import time
+import math
+import itertools
+import shutil
+import json
 import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 
 import ffmpeg
 
 
-def create_thumbnail(in_path: str, out_path: str):
+def create_thumbnail(in_path: str, out_path: str, at: float = 1):
     try:
-        ffmpeg.input(in_path, ss=1) \
+        ffmpeg.input(in_path, ss=at) \
               .filter('scale', 500, -1) \
               .output(out_path, vframes=1) \
               .run()
@@ -17,21 +26,137 @@ def create_thumbnail(in_path: str, out_path: str):
         return False
 
 
-def get_duration(path):
-    result = subprocess.run(["ffprobe", "-v", "error", "-show_entries",
-                             "format=duration", "-of",
-                             "default=noprint_wrappers=1:nokey=1", path],
+def parse_rate(rate):
+    # frame rates are reported as fractions, e.g. 30000/1001
+    try:
+        numerator, denominator = (int(part) for part in rate.split('/'))
+        return numerator / denominator if numerator and denominator else None
+    except (AttributeError, ValueError):
+        return None
+
+
+def kbit(bit_rate):
+    return int(bit_rate) // 1000 if bit_rate else None
+
+
+def side_data(stream, side_data_type):
+    for data in stream.get("side_data_list", []):
+        if data.get("side_data_type") == side_data_type:
+            return data
+    return {}
+
+
+# stereo layouts as reported by the Stereo 3D side data of mp4 and the
+# stereo_mode tag of matroska, mapped to the layout of the frame
+STEREO_MODES = {
+    "2d": "mono",
+    "mono": "mono",
+    "top and bottom": "top_bottom",
+    "top_bottom": "top_bottom",
+    "bottom_top": "top_bottom",
+    "side by side": "side_by_side",
+    "left_right": "side_by_side",
+    "right_left": "side_by_side",
+}
+
+
+def probe(path) -> dict:
+    """
+    Probes the file with a single ffprobe run and returns the metadata all
+    processing steps need: duration in seconds, the display resolution,
+    frame rate, codecs and bitrates (kbit/s) of the first video and audio
+    stream, and the rotation, spherical projection and stereo layout found
+    in the side data or tags. Values that are not known are None.
+    """
+    result = subprocess.run(["ffprobe", "-v", "error", "-show_format", "-show_streams",
+                             "-of", "json", str(path)],
                             stdout=subprocess.PIPE,
-                            stderr=subprocess.STDOUT)
-    return int(float(result.stdout))
+                            check=True)
+    info = json.loads(result.stdout)
+
+    fmt = info.get("format", {})
+    video = next((stream for stream in info.get("streams", []) if stream["codec_type"] == "video"
+                  and not stream.get("disposition", {}).get("attached_pic")), {})
+    audio = next((stream for stream in info.get("streams", []) if stream["codec_type"] == "audio"), {})
+
+    rotation = side_data(video, "Display Matrix").get("rotation")
+    if rotation is None:
+        rotation = video.get("tags", {}).get("rotate", 0)
+    rotation = int(float(rotation)) % 360
+
+    # ffmpeg rotates the video when decoding, report the size as displayed
+    width, height = video.get("width"), video.get("height")
+    if rotation in (90, 270):
+        width, height = height, width
+
+    stereo_mode = side_data(video, "Stereo 3D").get("type") or video.get("tags", {}).get("stereo_mode")
+
+    duration = fmt.get("duration") or video.get("duration")
+
+    return {
+        "format": fmt.get("format_name"),
+        "duration": float(duration) if duration else None,
+        "bitrate": kbit(fmt.get("bit_rate")),
+        "width": width,
+        "height": height,
+        "fps": parse_rate(video.get("avg_frame_rate")) or parse_rate(video.get("r_frame_rate")),
+        "video_codec": video.get("codec_name"),
+        "video_profile": video.get("profile"),
+        "pix_fmt": video.get("pix_fmt"),
+        # containers like webm only report the bitrate of the whole file
+        "video_bitrate": kbit(video.get("bit_rate")) or kbit(fmt.get("bit_rate")),
+        "audio_codec": audio.get("codec_name"),
+        "audio_channels": audio.get("channels"),
+        "channel_layout": audio.get("channel_layout"),
+        "audio_bitrate": kbit(audio.get("bit_rate")),
+        "rotation": rotation,
+        "projection": side_data(video, "Spherical Mapping").get("projection"),
+        "stereo_mode": STEREO_MODES.get(stereo_mode.lower()) if stereo_mode else None,
+    }
 
 
-def get_channel_layout(path):
-    result = subprocess.run(["ffprobe", "-select_streams", "a", "-show_entries",
-                             "stream=channel_layout", "-of", "csv=p=0", path],
-                             stdout=subprocess.PIPE,
-                             stderr=subprocess.DEVNULL)
-    return str(result.stdout)
+# filters that crop the two halves of a frame per stereo layout
+STEREO_HALVES = {
+    "top_bottom": ('crop=iw:ih/2:0:0', 'crop=iw:ih/2:0:ih/2'),
+    "side_by_side": ('crop=iw/2:ih:0:0', 'crop=iw/2:ih:iw/2:0'),
+}
+# SSIM between the halves of the frames above which they are taken to be the
+# views of the two eyes, which only differ by parallax
+STEREO_SIMILARITY = 0.75
+
+
+def halves_similarity(path, layout: str, start: float, seconds: int = 5) -> float:
+    """
+    Mean SSIM between the halves of the frames of the source in the given
+    stereo layout, over a frame per second from `start` on. Frames are
+    compared at a low resolution in grayscale, which is enough to tell two
+    views of the same scene from two directions of a 360 video.
+    """
+    first, second = STEREO_HALVES[layout]
+    result = subprocess.run(('ffmpeg', '-hide_banner',
+                             '-ss', str(start), '-t', str(seconds), '-i', str(path),
+                             '-lavfi', f'[0:v:0]fps=1,scale=512:-2,format=gray,split=2[a][b];[a]{first}[first];[b]{second}[second];[first][second]ssim',
+                             '-f', 'null', '-'),
+                            stderr=subprocess.PIPE, text=True, check=True)
+    return float(re.findall(r'All:([\d.]+)', result.stderr)[-1])
+
+
+def detect_stereo(path, media: dict, compare_halves: bool = True) -> str:
+    """
+    Returns the stereo layout of the source: the one in its metadata if
+    given, otherwise the layout whose halves are similar in the middle of the
+    video if `compare_halves` is set. Frames with similar halves in both
+    layouts, like a black screen, are taken to be mono.
+    """
+    if media["stereo_mode"] is not None:
+        return media["stereo_mode"]
+    if not compare_halves:
+        return "mono"
+
+    start = max(0, media["duration"] / 2 - 2)
+    similar = [layout for layout in STEREO_HALVES
+               if halves_similarity(path, layout, start) >= STEREO_SIMILARITY]
+    return similar[0] if len(similar) == 1 else "mono"
 
 
 @dataclass
@@ -40,6 +165,8 @@ class HlsProfile:
     height: int
     video_bitrate: int  # kbit/s
     audio_bitrate: int  # kbit/s
+    copy: bool = False  # segment the source video as is instead of encoding it
+    codec: str = "h264"  # one of VIDEO_CODECS
 
 
 HLS_PROFILES = (
@@ -50,39 +177,1062 @@ HLS_PROFILES = (
 )
 
 
-def create_hls(inp_path: Path, output_dir: Path) -> None:
-    channel_layout = get_channel_layout(inp_path)
-    use_ambisonic = "ambisonic" in channel_layout # hack to convert ambisonic videos into mono for now...
+# Video codecs renditions can be encoded with: the ffmpeg encoder, its
+# options, and the bitrate relative to H.264 for about the same quality.
+# HEVC and AV1 can only be segmented as fmp4.
+VIDEO_CODECS = {
+    "h264": ("libx264", (), 1.0),
+    # keyframes have to be IDR frames at fixed positions to cut segments at
+    "hevc": ("libx265", ('-tag', 'hvc1', '-forced-idr', '1', '-x265-params', 'scenecut=0:open-gop=0:log-level=error'), 0.6),
+    "av1": ("libsvtav1", ('-preset', '10'), 0.5),
+}
+
+
+def add_codecs(ladder, codecs) -> list:
+    """
+    Returns the ladder with a rendition per profile and codec in `codecs`,
+    at the bitrate the codec needs for the quality of the H.264 rendition.
+    Renditions of the same size are kept together, so the scale cascade
+    never scales up.
+    """
+    return [replace(prof, codec=codec, video_bitrate=round(prof.video_bitrate * VIDEO_CODECS[codec][2]))
+            for prof in ladder for codec in codecs]
+
+
+# v360 output formats of the projections a video can be transcoded to, both
+# cube layouts have 3x2 faces
+PROJECTIONS = {
+    "equirectangular": "e",
+    "cubemap": "c3x2",
+    "eac": "eac",
+}
+
+
+# v360 input options of the projections a source can be in
+SOURCE_PROJECTIONS = {
+    "equirectangular": "input=e",
+    "cubemap": "input=c3x2",
+    "eac": "input=eac",
+    # 360 videos downloaded from YouTube, see video-from-youtube.md
+    "youtube": "input=c3x2:in_forder=lfrdbu:in_frot=000313",
+    # a single 180 degree lens
+    "fisheye": "input=fisheye:ih_fov=180:iv_fov=180",
+}
+
+# projections reported in the Spherical Mapping side data that are known
+PROBED_PROJECTIONS = {
+    "equirectangular": "equirectangular",
+    "cubemap": "cubemap",
+    "fisheye": "fisheye",
+}
+
+
+def equator_width(width: int, height: int, source_projection: str = "equirectangular") -> int:
+    """
+    Horizontal resolution of the full circle along the equator of a source
+    """
+    if source_projection in ("cubemap", "eac", "youtube"):
+        return width * 4 // 3  # 3 faces across
+    if source_projection == "fisheye":
+        return width * 2  # half of the circle
+    return width
+
+
+def projected_size(width: int, height: int, projection: str = "equirectangular", source_projection: str = "equirectangular") -> tuple:
+    """
+    Size of a `width`x`height` source frame after reprojection, keeping the
+    resolution along the equator. Every cube face gets the resolution of a
+    quarter of the equator.
+    """
+    if projection == source_projection == "equirectangular":
+        return width, height
+    equator = equator_width(width, height, source_projection) // 4 * 4
+    if projection == "equirectangular":
+        return equator, equator // 2
+    face = equator // 4 // 2 * 2
+    return face * 3, face * 2
+
+
+def needs_reprojection(projection: str, source_projection: str) -> bool:
+    return projection != "equirectangular" or source_projection != "equirectangular"
+
+
+def projection_filter(projection: str, width: int, height: int, source_projection: str = "equirectangular") -> str:
+    return f'v360={SOURCE_PROJECTIONS[source_projection]}:output={PROJECTIONS[projection]}:w={width}:h={height}'
+
+
+def fit(prof: HlsProfile, width: int, height: int) -> tuple:
+    """
+    Returns the size `scale_filter` gives a `width`x`height` video for this
+    profile: scaled to fit the profile, keeping the aspect ratio, rounded
+    down to even dimensions
+    """
+    factor = min(prof.width / width, prof.height / height)
+    return int(width * factor) // 2 * 2, int(height * factor) // 2 * 2
+
+
+# longest keyframe interval (seconds) of a source that is remuxed, the other
+# renditions get their keyframes at the same positions
+REMUX_MAX_KEYFRAME_INTERVAL = 4
+
+
+def keyframe_interval(path, seconds: int = 120):
+    """
+    Returns the longest interval in seconds between keyframes of the video
+    in the first `seconds` of the file. Only reads packets, nothing is decoded.
+    """
+    result = subprocess.run(["ffprobe", "-v", "error", "-select_streams", "v:0",
+                             "-read_intervals", f"%+{seconds}",
+                             "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", str(path)],
+                            stdout=subprocess.PIPE,
+                            text=True,
+                            check=True)
+    times = []
+    for line in result.stdout.splitlines():
+        pts_time, _, flags = line.partition(',')
+        if 'K' in flags and pts_time != 'N/A':
+            times.append(float(pts_time))
+
+    if len(times) < 2:
+        return None
+    times.sort()
+    return max(b - a for a, b in zip(times, times[1:]))
+
+
+def can_remux(prof: HlsProfile, media: dict) -> bool:
+    """
+    Whether the source video can be used for this rendition as is: H.264
+    4:2:0 at exactly the size of the rendition and at most its bitrate
+    """
+    return (prof.codec == "h264"
+            and media["video_codec"] == "h264"
+            and media["pix_fmt"] == "yuv420p"
+            and not media["rotation"]
+            and (media["width"], media["height"]) == (prof.width, prof.height)
+            and media["video_bitrate"] is not None
+            and media["video_bitrate"] <= prof.video_bitrate)
+
+
+def remux_matching_rendition(ladder, media: dict, path) -> list:
+    """
+    Marks the rendition that matches the source to be copied instead of
+    encoded, if the source has keyframes at short enough intervals to cut
+    it into segments
+    """
+    if not any(can_remux(prof, media) for prof in ladder):
+        return ladder
+
+    interval = keyframe_interval(path)
+    if interval is None or interval > REMUX_MAX_KEYFRAME_INTERVAL:
+        return ladder
+
+    return [replace(prof, copy=True) if can_remux(prof, media) else prof for prof in ladder]
+
+
+def select_ladder(profiles, width: int, height: int, bitrate: int = None) -> list:
+    """
+    Selects the renditions worth encoding for a `width`x`height` source.
+    Profiles that would scale the source up are dropped, except for the
+    smallest of them which is clamped to the source resolution, and no
+    rendition gets a higher bitrate than the source. The sizes of the
+    returned profiles are the exact output sizes.
+    """
+    profiles = sorted(profiles, key=lambda prof: prof.width * prof.height, reverse=True)
+    upscaled = [prof for prof in profiles if width <= prof.width and height <= prof.height]
+
+    ladder = []
+    if upscaled:
+        ladder.append(replace(upscaled[-1], width=width // 2 * 2, height=height // 2 * 2))
+    for prof in profiles:
+        if prof not in upscaled:
+            out_width, out_height = fit(prof, width, height)
+            ladder.append(replace(prof, width=out_width, height=out_height))
+
+    if bitrate:
+        ladder = [replace(prof, video_bitrate=min(prof.video_bitrate, bitrate)) for prof in ladder]
+
+    return ladder
+
+
+def eye_size(width: int, height: int, stereo: str = "mono") -> tuple:
+    # size of the view of one eye in a frame with the given stereo layout
+    if stereo == "top_bottom":
+        return width, height // 2
+    if stereo == "side_by_side":
+        return width // 2, height
+    return width, height
+
+
+def select_stereo_ladder(profiles, width: int, height: int, stereo: str, bitrate: int = None) -> list:
+    """
+    Like `select_ladder` for stereo sources, but the profiles apply to each
+    eye: every eye gets as many pixels as the profile has, in the shape of
+    the eye, and the rendition twice its bitrate. Fitting the packed frame
+    in the profile would leave every eye with half of the pixels, and only
+    half of the lines of the profile for a wide top-bottom frame.
+    """
+    if stereo == "mono":
+        return select_ladder(profiles, width, height, bitrate)
+
+    eye_width, eye_height = eye_size(width, height, stereo)
+    boxes = []
+    for prof in profiles:
+        box_height = math.sqrt(prof.width * prof.height * eye_height / eye_width)
+        boxes.append(replace(prof, width=round(box_height * eye_width / eye_height), height=round(box_height)))
+
+    ladder = []
+    for prof in select_ladder(boxes, eye_width, eye_height, bitrate // 2 if bitrate else None):
+        packed = (prof.width, prof.height * 2) if stereo == "top_bottom" else (prof.width * 2, prof.height)
+        # the exact size `scale_filter` gives the packed frame
+        out_width, out_height = fit(replace(prof, width=packed[0], height=packed[1]), width, height)
+        ladder.append(replace(prof, width=out_width, height=out_height, video_bitrate=prof.video_bitrate * 2))
+    return ladder
+
+
+def progress_value(block, key, type_=float):
+    try:
+        return type_(block.get(key, '').rstrip('x'))
+    except ValueError:  # ffmpeg reports N/A until it knows the value
+        return None
+
+
+def parse_progress(lines, duration=None):
+    """
+    Parses the key=value output of `ffmpeg -progress` and yields a report
+    for every block. `duration` (seconds) of the input is used to estimate
+    the time left.
+    """
+    block = {}
+    for line in lines:
+        key, _, value = line.strip().partition('=')
+        block[key] = value
+        if key != 'progress':
+            continue
+
+        out_time_us = progress_value(block, 'out_time_us', int)
+        out_time = out_time_us / 1e6 if out_time_us is not None else None
+        speed = progress_value(block, 'speed')
+
+        time_left = None
+        if duration and out_time is not None and speed:
+            time_left = max(duration - out_time, 0) / speed
+
+        yield {
+            "state": "running" if value == 'continue' else "encoded",
+            "frame": progress_value(block, 'frame', int),
+            "fps": progress_value(block, 'fps'),
+            "speed": speed,
+            "out_time": out_time,
+            "duration": duration,
+            "time_left": time_left,
+        }
+        block = {}
+
+
+def run_ffmpeg(args, duration=None, progress=None) -> None:
+    """
+    Runs ffmpeg with the given arguments. If a `progress` callback is given,
+    ffmpeg writes machine readable progress to stdout which is parsed and
+    passed to the callback.
+    """
+    if progress is None:
+        subprocess.check_call(args)
+        return
+
+    args = (args[0], '-progress', 'pipe:1', '-nostats') + tuple(args[1:])
+    with subprocess.Popen(args, stdout=subprocess.PIPE, text=True) as proc:
+        for report in parse_progress(proc.stdout, duration):
+            progress(report)
+
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, args)
+
+
+def x264_args(profiles, boundaries: list = None, threads: int = 0) -> tuple:
+    """
+    x264 settings shared by the single pass and the chunked encodes. A fixed
+    GOP keeps the segments of all renditions aligned, unless a rendition is
+    copied from the source: then keyframes are placed where the source has
+    them. With planned segment `boundaries` (see `segment_boundaries`)
+    keyframes are placed at the boundaries only. The keyframe settings apply
+    to the other codecs as well, their options from `encoder_args` follow.
+    Encoders use `threads` threads each, as many as ffmpeg sees cores if 0.
+    """
+    if boundaries:
+        keyframes = force_key_frames_args(profiles, ','.join(f'{t:.3f}' for t in boundaries)) + ('-g', '1000')
+    elif any(prof.copy for prof in profiles):
+        keyframes = force_key_frames_args(profiles, 'source')
+    else:
+        keyframes = ('-g', '30')
+    return ('-preset', 'veryfast') + keyframes + ('-sc_threshold', '0') + threads_args(threads)
+
+
+def force_key_frames_args(profiles, keyframes: str) -> tuple:
+    # without a stream specifier ffmpeg only forces the keyframes of the
+    # first video stream of an output, so every rendition gets its own
+    args = ()
+    for i in range(len(profiles)):
+        args += (f'-force_key_frames:v:{i}', keyframes)
+    return args
+
+
+def threads_args(threads: int) -> tuple:
+    return ('-threads', str(threads)) if threads else ()
+
+
+def scale_filter(prof: HlsProfile) -> str:
+    return f'scale={prof.width}:{prof.height}:force_original_aspect_ratio=decrease:force_divisible_by=2'
+
+
+def ladder_filter(profiles, source: str = '0:v:0', projection: str = "equirectangular", source_projection: str = "equirectangular") -> str:
+    """
+    Builds a filter graph that decodes the video once and scales it down in a
+    cascade, every rendition being scaled from the one above it instead of
+    from the full resolution source. The renditions are labeled [v0], [v1]...
+    Renditions that are copied from the source are left out. Sources that
+    are not equirectangular or are transcoded to another projection are
+    reprojected once, in the same pass, at the size of the largest rendition.
+    """
+    encoded = [(i, prof) for i, prof in enumerate(profiles) if not prof.copy]
+
+    graph = []
+    previous = source
+    if needs_reprojection(projection, source_projection) and encoded:
+        top = encoded[0][1]
+        graph.append(f'[{source}]{projection_filter(projection, top.width, top.height, source_projection)}[p]')
+        previous = 'p'
+    for n, (i, prof) in enumerate(encoded):
+        if n == len(encoded) - 1:
+            graph.append(f'[{previous}]{scale_filter(prof)}[v{i}]')
+        else:
+            graph.append(f'[{previous}]{scale_filter(prof)},split=2[v{i}][c{i}]')
+            previous = f'c{i}'
+    return ';'.join(graph)
+
+
+def filter_args(profiles, projection: str = "equirectangular", source_projection: str = "equirectangular") -> tuple:
+    graph = ladder_filter(profiles, projection=projection, source_projection=source_projection)
+    return ('-filter_complex', graph) if graph else ()
+
+
+def map_args(i: int, prof: HlsProfile, source: str = '0:v:0') -> tuple:
+    return ('-map', source if prof.copy else f'[v{i}]')
+
+
+def encoder_args(prof: HlsProfile, stream: str = ':v') -> tuple:
+    # codec options of the rendition for the output stream `stream`
+    encoder, options, _ = VIDEO_CODECS[prof.codec]
+    args = (f'-c{stream}', encoder,
+            f'-b{stream}', f'{prof.video_bitrate}k')
+    for name, value in zip(options[::2], options[1::2]):
+        args += (f'{name}{stream}', value)
+    return args
+
+
+def video_args(i: int, prof: HlsProfile) -> tuple:
+    if prof.copy:
+        return (f'-c:v:{i}', 'copy')
+    return encoder_args(prof, f':v:{i}')
+
+
+def use_ambisonic_hack(media: dict) -> bool:
+    return "ambisonic" in (media.get("channel_layout") or "") # hack to convert ambisonic videos into mono for now...
+
+
+def audio_args(profiles, media: dict) -> tuple:
+    """
+    The audio is encoded once and shared by all renditions as an HLS audio
+    group, at the highest audio bitrate of the ladder. AAC sources that are
+    within that bitrate are copied.
+    """
+    bitrate = max(prof.audio_bitrate for prof in profiles)
+
+    if use_ambisonic_hack(media):
+        return ('-filter:a', 'pan=mono|c0=FL',
+                '-c:a', 'aac',
+                '-b:a', f'{bitrate}k')
+
+    if (media.get("audio_codec") == "aac" and (media.get("audio_channels") or 0) <= 2
+            and media.get("audio_bitrate") and media["audio_bitrate"] <= bitrate):
+        return ('-c:a', 'copy')
+
+    return ('-c:a', 'aac',
+            '-b:a', f'{bitrate}k')
+
+
+# target duration of the segments of all streams
+SEGMENT_SECONDS = 6
+
+
+# Segment formats: "mpegts" writes an HLS stream with TS segments, "fmp4"
+# writes CMAF segments (fragmented MP4) once and describes them both in an HLS
+# playlist and in a DASH manifest.
+SEGMENT_TYPES = ("mpegts", "fmp4")
+
+
+def playlist_name(i: int, segment_type: str = "mpegts") -> str:
+    """
+    Name of the media playlist of the i-th video rendition
+    """
+    return f'media_{i}.m3u8' if segment_type == "fmp4" else f'v{i}.m3u8'
+
+
+# segments that start at a cue point are kept short, so playback from a cue
+# point can start after loading little data
+CUE_SEGMENT_SECONDS = 2
+
+
+def segment_boundaries(duration: float, cue_points, target: int = SEGMENT_SECONDS, initial=()) -> list:
+    """
+    Plans the start times of the segments of a video that has to be playable
+    right from its `cue_points` (seconds): every cue point starts a short
+    segment, the time in between is cut into segments of at most `target`
+    seconds. The video starts with segments of the `initial` durations, so
+    playback can start quickly.
+    """
+    anchors = {0.0}
+    for end in itertools.accumulate(initial):
+        if end < duration:
+            anchors.add(float(end))
+    for cue in cue_points:
+        if 0 < cue < duration:
+            anchors.add(float(cue))
+            if cue + CUE_SEGMENT_SECONDS < duration:
+                anchors.add(float(cue + CUE_SEGMENT_SECONDS))
+    anchors = sorted(anchors) + [duration]
+
+    boundaries = []
+    for start, end in zip(anchors, anchors[1:]):
+        parts = max(1, math.ceil((end - start) / target))
+        boundaries += [start + (end - start) * k / parts for k in range(parts)]
+    return boundaries
+
+
+def chunk_keyframes(boundaries, start: float, end: float):
+    """
+    The boundaries within a chunk of the source, relative to its start. The
+    first frame of a chunk is always a keyframe.
+    """
+    if not boundaries:
+        return None
+    return [0.0] + [t - start for t in boundaries if start < t < end]
+
+
+def output_args(output_dir: Path, profiles, audio: tuple, segment_type: str = "mpegts", boundaries: list = None) -> tuple:
+    """
+    Output arguments for the mapped video renditions and the shared audio
+    stream, `audio` being the map and codec arguments of the audio
+    """
+    if segment_type == "fmp4":
+        return audio + cmaf_output_args(output_dir, boundaries, profiles)
+    if boundaries:
+        return cue_hls_output_args(output_dir, len(profiles), audio)
+    return audio + hls_output_args(output_dir, len(profiles))
+
+
+def adaptation_sets(profiles) -> str:
+    # DASH needs an adaptation set per codec, the audio stream follows the video
+    codecs = list(dict.fromkeys(prof.codec for prof in profiles))
+    sets = [f'id={k},streams=' + ','.join(str(i) for i, prof in enumerate(profiles) if prof.codec == codec)
+            for k, codec in enumerate(codecs)]
+    sets.append(f'id={len(codecs)},seg_duration={SEGMENT_SECONDS},streams=a')
+    return ' '.join(sets)
+
+
+def cmaf_output_args(output_dir: Path, boundaries: list = None, profiles=HLS_PROFILES) -> tuple:
+    # the DASH muxer writes main.mpd, and with hls_playlist a media_<i>.m3u8
+    # per stream, all over the same segments; `write_master_playlist` replaces
+    # its main.m3u8. With planned boundaries video only has keyframes at the
+    # boundaries, so cutting at every keyframe gives the planned segments.
+    video_seconds = 1 if boundaries else SEGMENT_SECONDS
+    return ('-f', 'dash',
+            '-seg_duration', str(video_seconds),
+            '-use_template', '1',
+            '-use_timeline', '1',
+            '-dash_segment_type', 'mp4',
+            '-adaptation_sets', adaptation_sets(profiles),
+            '-init_seg_name', 'v$RepresentationID$-init.m4s',
+            '-media_seg_name', 'v$RepresentationID$-s$Number$.m4s',
+            '-hls_playlist', '1',
+            '-hls_master_name', 'main.m3u8',
+            f'{output_dir}/main.mpd')
+
+
+def hls_output_args(output_dir: Path, renditions: int) -> tuple:
+    # video renditions are written to v<i>.m3u8, the shared audio to vaudio.m3u8
+    var_stream_map = [f"v:{i},agroup:audio" for i in range(renditions)]
+    var_stream_map.append("a:0,agroup:audio,name:audio")
+
+    return ('-var_stream_map', ' '.join(var_stream_map),
+            '-f', 'hls',
+            '-hls_time', str(SEGMENT_SECONDS),
+            '-hls_list_size', '0',
+            '-hls_playlist_type', 'vod',
+            '-hls_segment_type', 'mpegts',
+            '-master_pl_name', f'main.m3u8',
+            '-hls_segment_filename', f'{output_dir}/v%v-s%d.ts', f'{output_dir}/v%v.m3u8')
+
+
+def cue_hls_output_args(output_dir: Path, renditions: int, audio: tuple, names=None) -> tuple:
+    # video only has keyframes at the planned boundaries, so a short hls_time
+    # cuts at every keyframe. Audio has no keyframes to cut at and gets
+    # regular segments from a second output, `write_master_playlist` ties the
+    # playlists of both outputs together. `names` are the rendition numbers
+    # of the mapped video streams, when only some renditions are encoded.
+    if names is None:
+        names = range(renditions)
+    video = ('-var_stream_map', ' '.join(f"v:{k},name:{name}" for k, name in enumerate(names)),
+             '-f', 'hls',
+             '-hls_time', '1',
+             '-hls_list_size', '0',
+             '-hls_playlist_type', 'vod',
+             '-hls_segment_type', 'mpegts',
+             '-hls_segment_filename', f'{output_dir}/v%v-s%d.ts', f'{output_dir}/v%v.m3u8')
+    if not audio:
+        return video
+    return video + audio + (
+            '-f', 'hls',
+            '-hls_time', str(SEGMENT_SECONDS),
+            '-hls_list_size', '0',
+            '-hls_playlist_type', 'vod',
+            '-hls_segment_type', 'mpegts',
+            '-hls_segment_filename', f'{output_dir}/vaudio-s%d.ts', f'{output_dir}/vaudio.m3u8')
+
+
+# profiles as named by ffprobe and as written in RFC 6381 codec strings
+AVC_PROFILES = {"Constrained Baseline": "42E0", "Baseline": "4200", "Main": "4D40", "High": "6400", "High 10": "6E00"}
+HEVC_PROFILES = {"Main": "1.6", "Main 10": "2.4"}
+AV1_PROFILES = {"Main": "0", "High": "1", "Professional": "2"}
+AAC_PROFILES = {"LC": "2", "HE-AAC": "5", "HE-AACv2": "29"}
+
+
+def codec_string(stream: dict):
+    """
+    Returns the codec string of a stream probed by ffprobe, as used in the
+    CODECS attribute of HLS playlists, or None if it is not known
+    """
+    name, profile, level = stream.get("codec_name"), stream.get("profile"), stream.get("level")
+    if name == "aac" and profile in AAC_PROFILES:
+        return f'mp4a.40.{AAC_PROFILES[profile]}'
+    if level is None or level < 0:
+        return None
+    if name == "h264" and profile in AVC_PROFILES:
+        return f'avc1.{AVC_PROFILES[profile]}{level:02X}'
+    if name == "hevc" and profile in HEVC_PROFILES:
+        return f'hvc1.{HEVC_PROFILES[profile]}.L{level}.B0'
+    if name == "av1" and profile in AV1_PROFILES:
+        depth = "10" if "10" in (stream.get("pix_fmt") or "") else "08"
+        return f'av01.{AV1_PROFILES[profile]}.{level:02d}M.{depth}'
+    return None
+
+
+def playlist_codec(path: Path):
+    # codec string of the first stream of a media playlist, None if ffprobe
+    # can not read it: the variant is then listed without CODECS
+    try:
+        result = subprocess.run(('ffprobe', '-v', 'error', '-show_streams', '-of', 'json', path.as_posix()),
+                                stdout=subprocess.PIPE, check=True)
+    except subprocess.CalledProcessError:
+        return None
+    streams = json.loads(result.stdout).get("streams", [])
+    return codec_string(streams[0]) if streams else None
+
+
+def write_master_playlist(output_dir: Path, profiles, available=None, segment_type: str = "mpegts", playlists=None) -> None:
+    """
+    Writes main.m3u8 over the media playlists of the renditions and the
+    shared audio, with the codecs of every variant that ffprobe can read, so
+    players skip the renditions they can not decode. Only the renditions numbered in
+    `available` are listed, if given. `playlists` are the media playlists of
+    the renditions, named by `playlist_name` if not given. The playlist is
+    replaced in one step, players never load a partial one.
+    """
+    if playlists is None:
+        playlists = [playlist_name(i, segment_type) for i in range(len(profiles))]
+    if segment_type == "fmp4":
+        # the DASH muxer numbers the playlists by stream, audio follows the video
+        version, audio_playlist = 7, playlist_name(len(profiles), segment_type)
+    else:
+        version, audio_playlist = 3, 'vaudio.m3u8'
+    audio_bitrate = max(prof.audio_bitrate for prof in profiles)
+    audio_codec = playlist_codec(Path(output_dir, audio_playlist))
+
+    lines = ['#EXTM3U',
+             f'#EXT-X-VERSION:{version}',
+             f'#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="audio",NAME="audio",DEFAULT=YES,AUTOSELECT=YES,URI="{audio_playlist}"']
+    for i, prof in enumerate(profiles):
+        if available is not None and i not in available:
+            continue
+        attributes = f'BANDWIDTH={(prof.video_bitrate + audio_bitrate) * 1000},RESOLUTION={prof.width}x{prof.height}'
+        video_codec = playlist_codec(Path(output_dir, playlists[i]))
+        if video_codec and audio_codec:
+            attributes += f',CODECS="{video_codec},{audio_codec}"'
+        lines += [f'#EXT-X-STREAM-INF:{attributes},AUDIO="audio"',
+                  playlists[i]]
+
+    tmp_path = Path(output_dir, 'main.m3u8.tmp')
+    tmp_path.write_text('\n'.join(lines) + '\n')
+    os.replace(tmp_path, Path(output_dir, 'main.m3u8'))
+
+
+def create_hls(inp_path: Path, output_dir: Path, profiles=HLS_PROFILES, media: dict = None, progress=None, segment_type: str = "mpegts", projection: str = "equirectangular", source_projection: str = "equirectangular", boundaries: list = None, threads: int = 0) -> None:
+    """
+    Transcodes the source into an HLS stream with a rendition per profile.
+    `media` is the result of `probe` for the source, `segment_type` one of
+    `SEGMENT_TYPES`, `projection` one of `PROJECTIONS` and `source_projection`
+    one of `SOURCE_PROJECTIONS`. Segments start at the planned `boundaries`
+    if given, renditions can then not be copied.
+    """
+    media = media or {}
+    if boundaries:
+        profiles = [replace(prof, copy=False) for prof in profiles]
+
+    args = ('ffmpeg',
+            '-hide_banner',
+            '-i', inp_path.as_posix()) + filter_args(profiles, projection, source_projection) + x264_args(profiles, boundaries, threads)
+
+    for i, prof in enumerate(profiles):
+        args += map_args(i, prof) + video_args(i, prof)
+
+    # Output
+    args += output_args(output_dir, profiles, ('-map', '0:a:0') + audio_args(profiles, media), segment_type, boundaries)
+
+    # now call ffmpeg
+    run_ffmpeg(args, media.get("duration"), progress)
+
+    write_master_playlist(output_dir, profiles, segment_type=segment_type)
+
+
+def encode_renditions(inp_path: Path, output_dir: Path, profiles, renditions: list, media: dict, progress=None, projection: str = "equirectangular", source_projection: str = "equirectangular", boundaries: list = None, audio: bool = True, names: list = None, threads: int = 0) -> None:
+    """
+    Encodes only the numbered `renditions` of the ladder into their usual
+    playlists, or into the playlists numbered by `names` if given, and the
+    audio if `audio` is set. Segments start at the planned `boundaries`, so
+    the renditions line up with ones encoded separately.
+    """
+    selected = [replace(profiles[i], copy=False) for i in renditions]
+
+    args = ('ffmpeg',
+            '-hide_banner',
+            '-i', inp_path.as_posix()) + filter_args(selected, projection, source_projection) + x264_args(selected, boundaries, threads)
+
+    for k, prof in enumerate(selected):
+        args += map_args(k, prof) + video_args(k, prof)
+
+    audio_args_ = ('-map', '0:a:0') + audio_args(profiles, media) if audio else ()
+    args += cue_hls_output_args(output_dir, len(selected), audio_args_, renditions if names is None else names)
+
+    run_ffmpeg(args, media.get("duration"), progress)
+
+
+def playlist_boundaries(path: Path) -> list:
+    """
+    The start times of the segments of a media playlist, so renditions can
+    be encoded that line up with it
+    """
+    boundaries, start = [], 0.0
+    for line in path.read_text().splitlines():
+        if line.startswith('#EXTINF:'):
+            boundaries.append(start)
+            start += float(line[len('#EXTINF:'):].split(',')[0])
+    # durations are rounded, a keyframe is forced on the first frame at or
+    # after its time, so stay just before the frame that starts the segment
+    return [max(0.0, t - 0.001) for t in boundaries]
+
+
+def create_hls_progressive(inp_path: Path, output_dir: Path, profiles=HLS_PROFILES, media: dict = None, progress=None, projection: str = "equirectangular", source_projection: str = "equirectangular", boundaries: list = None, published=None, threads: int = 0) -> None:
+    """
+    Same output as `create_hls` with TS segments, but the lowest rendition
+    and the audio are encoded first and published in main.m3u8, so the video
+    can be played while the other renditions are encoded in a second pass.
+    `published` is called once the first rendition is playable.
+    """
+    media = media or {}
+    boundaries = boundaries or segment_boundaries(media["duration"], [])
+    lowest = len(profiles) - 1
+
+    encode_renditions(inp_path, output_dir, profiles, [lowest], media, progress, projection, source_projection, boundaries, threads=threads)
+    write_master_playlist(output_dir, profiles, [lowest])
+    if published is not None:
+        published()
+
+    if lowest > 0:
+        encode_renditions(inp_path, output_dir, profiles, list(range(lowest)), media, progress, projection, source_projection, boundaries, audio=False, threads=threads)
+        write_master_playlist(output_dir, profiles)
+
+
+# Segment-parallel encoding: the source is cut into chunks at keyframes, the
+# chunks are encoded independently (in a local pool or as separate jobs) and
+# the encoded chunks are stitched into the same HLS layout as `create_hls`.
+
+def split_source(inp_path: Path, work_dir: Path, chunk_seconds: int) -> list:
+    """
+    Cuts the video stream of the source into chunks of about `chunk_seconds`
+    without re-encoding. Cuts are made at the first keyframe after each
+    interval, so every chunk can be decoded on its own. The times of the
+    chunks in the source are listed in chunks.csv, see `chunk_times`.
+    """
+    subprocess.check_call(('ffmpeg',
+                           '-hide_banner',
+                           '-i', inp_path.as_posix(),
+                           '-map', '0:v:0',
+                           '-c', 'copy',
+                           '-f', 'segment',
+                           '-segment_time', str(chunk_seconds),
+                           '-reset_timestamps', '1',
+                           '-segment_list', f'{work_dir}/chunks.csv',
+                           '-segment_list_type', 'csv',
+                           f'{work_dir}/source-%05d.mkv'))
+    return sorted(work_dir.glob('source-*.mkv'))
+
+
+def chunk_times(work_dir: Path) -> dict:
+    """
+    Returns the (start, end) time in the source of every chunk by file name
+    """
+    times = {}
+    for line in Path(work_dir, 'chunks.csv').read_text().splitlines():
+        name, start, end = line.rsplit(',', 2)
+        times[name] = (float(start), float(end))
+    return times
+
+
+def encoded_chunk_path(chunk_path: Path, i: int) -> Path:
+    return chunk_path.with_name(f'v{i}-{chunk_path.stem}.mp4')
+
+
+def encode_chunk(chunk_path, profiles=HLS_PROFILES, projection: str = "equirectangular", source_projection: str = "equirectangular", keyframes: list = None, threads: int = 0) -> None:
+    """
+    Encodes a source chunk into every rendition. Decodes the chunk once and
+    writes one file per rendition next to it, renditions that are copied
+    from the source are only remuxed. `keyframes` are the segment boundaries
+    within the chunk, see `chunk_keyframes`. Encoders use `threads` threads.
+    """
+    chunk_path = Path(chunk_path)
+    args = ('ffmpeg', '-hide_banner', '-y',
+            '-i', chunk_path.as_posix()) + filter_args(profiles, projection, source_projection)
+    for i, prof in enumerate(profiles):
+        if prof.copy:
+            args += ('-map', '0:v:0', '-c:v', 'copy')
+        else:
+            args += ('-map', f'[v{i}]') + x264_args(profiles, keyframes, threads) + encoder_args(prof)
+        args += (encoded_chunk_path(chunk_path, i).as_posix(),)
+    subprocess.check_call(args)
+
+
+def stitch_hls(inp_path: Path, chunks: list, output_dir: Path, profiles=HLS_PROFILES, media: dict = None, progress=None, segment_type: str = "mpegts", boundaries: list = None) -> None:
+    """
+    Concatenates the encoded chunks of every rendition without re-encoding
+    and segments them into HLS, together with the audio of the source.
+    """
+    media = media or {}
+    args = ('ffmpeg', '-hide_banner')
+
+    for i, _ in enumerate(profiles):
+        concat_list = chunks[0].with_name(f'v{i}.txt')
+        concat_list.write_text(''.join(f"file '{encoded_chunk_path(chunk, i).as_posix()}'\n" for chunk in chunks))
+        args += ('-f', 'concat', '-safe', '0', '-i', concat_list.as_posix())
+
+    audio_input = len(profiles)
+    args += ('-i', inp_path.as_posix())
+
+    for i, _ in enumerate(profiles):
+        args += ('-map', f'{i}:v:0', f'-c:v:{i}', 'copy')
+
+    args += output_args(output_dir, profiles, ('-map', f'{audio_input}:a:0') + audio_args(profiles, media), segment_type, boundaries)
+
+    run_ffmpeg(args, media.get("duration"), progress)
+
+    write_master_playlist(output_dir, profiles, segment_type=segment_type)
+
+
+def create_hls_parallel(inp_path: Path, output_dir: Path, chunk_seconds: int, workers: int, profiles=HLS_PROFILES, media: dict = None, progress=None, segment_type: str = "mpegts", projection: str = "equirectangular", source_projection: str = "equirectangular", boundaries: list = None, threads: int = 0) -> None:
+    """
+    Same output as `create_hls`, but the chunks of the source are encoded by
+    `workers` ffmpeg processes in parallel. The `threads` (the cores of the
+    process if 0) are shared by the workers.
+    """
+    media = media or {}
+    if boundaries:
+        profiles = [replace(prof, copy=False) for prof in profiles]
+
+    work_dir = Path(output_dir, 'chunks')
+    work_dir.mkdir(exist_ok=True)
+
+    chunks = split_source(inp_path, work_dir, chunk_seconds)
+    times = chunk_times(work_dir)
+
+    chunk_threads = max(1, (threads or len(os.sched_getaffinity(0))) // workers)
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(encode_chunk, chunk, profiles, projection, source_projection, chunk_keyframes(boundaries, *times[chunk.name]), chunk_threads)
+                   for chunk in chunks]
+        for done, future in enumerate(as_completed(futures), 1):
+            future.result()
+            if progress is not None:
+                elapsed = time.monotonic() - started
+                progress({"state": "running", "chunks": len(chunks), "chunks_done": done,
+                          "duration": media.get("duration"), "time_left": elapsed / done * (len(chunks) - done)})
+
+    stitch_hls(inp_path, chunks, output_dir, profiles, media, progress, segment_type, boundaries)
+    shutil.rmtree(work_dir)
+
+
+# Tiled streaming: every rendition is cut into a grid of tiles that are
+# encoded as separate streams with aligned segments, so a player can fetch
+# the tiles in view at a higher quality than the rest of the sphere.
+
+def tile_edges(size: int, parts: int) -> list:
+    # even edges, so every tile can be encoded as 4:2:0
+    return [round(size * k / parts / 2) * 2 for k in range(parts + 1)]
+
+
+def tile_grid(width: int, height: int, columns: int, rows: int) -> list:
+    """
+    Returns the (x, y, width, height) of every tile of a `columns`x`rows`
+    grid over a `width`x`height` frame, row by row
+    """
+    xs, ys = tile_edges(width, columns), tile_edges(height, rows)
+    return [(xs[c], ys[r], xs[c + 1] - xs[c], ys[r + 1] - ys[r]) for r in range(rows) for c in range(columns)]
+
+
+def tile_filter(profiles, columns: int, rows: int, source: str = '0:v:0', source_projection: str = "equirectangular") -> str:
+    """
+    Scales the video to every rendition like `ladder_filter` and crops each
+    rendition into the tiles of the grid, labeled [t<tile>q<rendition>]
+    """
+    tiles = columns * rows
+    graph = [ladder_filter(profiles, source, source_projection=source_projection)]
+    for i, prof in enumerate(profiles):
+        graph.append(f'[v{i}]split={tiles}' + ''.join(f'[q{i}t{t}]' for t in range(tiles)))
+        for t, (x, y, w, h) in enumerate(tile_grid(prof.width, prof.height, columns, rows)):
+            graph.append(f'[q{i}t{t}]crop={w}:{h}:{x}:{y}[t{t}q{i}]')
+    return ';'.join(graph)
+
+
+def tile_bitrate(prof: HlsProfile, width: int, height: int) -> int:
+    # the bitrate of the rendition is shared by the tiles by area
+    return max(1, round(prof.video_bitrate * width * height / (prof.width * prof.height)))
+
+
+def tile_manifest(profiles, columns: int, rows: int) -> dict:
+    """
+    Describes the tiles for the player: their position on the frame as
+    fractions of its size and in degrees of yaw and pitch, and a playlist
+    per quality. Qualities are ordered from high to low like the ladder.
+    """
+    grids = [tile_grid(prof.width, prof.height, columns, rows) for prof in profiles]
+    top = profiles[0]
+
+    tiles = []
+    for t, (x, y, w, h) in enumerate(grids[0]):
+        tiles.append({
+            "id": t,
+            "column": t % columns,
+            "row": t // columns,
+            "x": x / top.width,
+            "y": y / top.height,
+            "width": w / top.width,
+            "height": h / top.height,
+            "yaw": [x / top.width * 360 - 180, (x + w) / top.width * 360 - 180],
+            "pitch": [90 - (y + h) / top.height * 180, 90 - y / top.height * 180],
+            "qualities": [{"playlist": f"t{t}q{i}.m3u8",
+                           "width": grid[t][2],
+                           "height": grid[t][3],
+                           "video_bitrate": tile_bitrate(prof, grid[t][2], grid[t][3])}
+                          for i, (prof, grid) in enumerate(zip(profiles, grids))],
+        })
+
+    return {
+        "projection": "equirectangular",
+        "columns": columns,
+        "rows": rows,
+        "segment_duration": SEGMENT_SECONDS,
+        "audio": "audio.m3u8",
+        "tiles": tiles,
+    }
+
+
+def create_tiles(inp_path: Path, output_dir: Path, columns: int, rows: int, profiles=HLS_PROFILES, media: dict = None, progress=None, source_projection: str = "equirectangular", threads: int = 0) -> None:
+    """
+    Encodes every rendition as a grid of independently decodable tiles, each
+    tile and quality as its own HLS stream t<tile>q<rendition>.m3u8, and
+    writes the tile manifest to tiles.json. The video is decoded once.
+    """
+    media = media or {}
+    # tiles are always encoded, a rendition copied from the source can not be cut
+    profiles = [replace(prof, copy=False) for prof in profiles]
+
     args = ('ffmpeg',
             '-hide_banner',
             '-i', inp_path.as_posix(),
-            '-preset', 'veryfast',
-            '-g', '30',
-            '-sc_threshold', '0',
-            '-movflags', 'frag_keyframe+empty_moov')  # fragmented MP4
+            '-filter_complex', tile_filter(profiles, columns, rows, source_projection=source_projection)) + x264_args(profiles, threads=threads)
 
     var_stream_map = []
-    for i, prof in enumerate(HLS_PROFILES):
-        args += ('-map', '0:0', '-map', '0:1')
-        if use_ambisonic:
-            args += (f'-filter:a:{i}', f'pan=mono|c0=FL')
-        args += (f'-filter:v:{i}', f'scale={prof.width}:{prof.height}:force_original_aspect_ratio=decrease',
-                 f'-c:v:{i}', 'libx264',
-                 f'-b:v:{i}', f'{prof.video_bitrate}k',
-                 f'-c:a:{i}', 'aac',
-                 f'-b:a:{1}', f'{prof.audio_bitrate}k')
-        var_stream_map.append(f"v:{i},a:{i}")
-
-    args += ('-var_stream_map', ' '.join(var_stream_map))
+    for t in range(columns * rows):
+        for i, prof in enumerate(profiles):
+            n = len(var_stream_map)
+            _, _, w, h = tile_grid(prof.width, prof.height, columns, rows)[t]
+            args += ('-map', f'[t{t}q{i}]',
+                     f'-c:v:{n}', 'libx264',
+                     f'-b:v:{n}', f'{tile_bitrate(prof, w, h)}k')
+            var_stream_map.append(f"v:{n},name:t{t}q{i}")
+    args += ('-map', '0:a:0') + audio_args(profiles, media)
+    var_stream_map.append("a:0,name:audio")
 
-    # Output
-    args += ('-f', 'hls',
-             '-hls_time', '6',
+    args += ('-var_stream_map', ' '.join(var_stream_map),
+             '-f', 'hls',
+             '-hls_time', str(SEGMENT_SECONDS),
              '-hls_list_size', '0',
              '-hls_playlist_type', 'vod',
              '-hls_segment_type', 'mpegts',
-             '-master_pl_name', f'main.m3u8',
-             '-hls_segment_filename', f'{output_dir}/v%v-s%d.ts', f'{output_dir}/v%v.m3u8')
+             '-hls_segment_filename', f'{output_dir}/%v-s%d.ts', f'{output_dir}/%v.m3u8')
 
-    # now call ffmpeg
+    run_ffmpeg(args, media.get("duration"), progress)
+
+    Path(output_dir, 'tiles.json').write_text(json.dumps(tile_manifest(profiles, columns, rows), indent=2))
+
+
+# Trickplay: small thumbnails at a fixed interval, tiled into sprite sheets
+# and indexed by a WebVTT thumbnail track, for scrubbing without loading video.
+
+def vtt_time(seconds: float) -> str:
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f'{int(hours):02d}:{int(minutes):02d}:{seconds:06.3f}'
+
+
+def trickplay_vtt(duration: float, interval: int, width: int, height: int, columns: int, rows: int) -> str:
+    """
+    Builds the WebVTT track that points every interval of the video to its
+    thumbnail in the sprite sheets, as sprite-<n>.jpg#xywh=x,y,w,h
+    """
+    cues = ['WEBVTT', '']
+    per_sheet = columns * rows
+    for n in range(math.ceil(duration / interval)):
+        sheet, index = divmod(n, per_sheet)
+        x, y = index % columns * width, index // columns * height
+        cues += [f'{vtt_time(n * interval)} --> {vtt_time(min((n + 1) * interval, duration))}',
+                 f'sprite-{sheet + 1:03d}.jpg#xywh={x},{y},{width},{height}',
+                 '']
+    return '\n'.join(cues)
+
+
+def create_trickplay(inp_path: Path, output_dir: Path, media: dict, interval: int = 2, width: int = 240, columns: int = 5, rows: int = 5, source_projection: str = "equirectangular") -> None:
+    """
+    Writes sprite sheets of `columns`x`rows` thumbnails, one every `interval`
+    seconds, and the WebVTT index trickplay.vtt to `output_dir`. Only the
+    keyframes of the source are decoded, so every thumbnail shows the last
+    keyframe before its time.
+    """
+    height = round(width * media["height"] / media["width"] / 2) * 2
+    if source_projection == "equirectangular":
+        thumbnail = f'scale={width}:{height}'
+    else:
+        # show every source as the equirectangular frame it will be played as
+        height = width // 4 * 2
+        thumbnail = projection_filter("equirectangular", width, height, source_projection)
+
+    subprocess.check_call(('ffmpeg', '-hide_banner', '-y',
+                           '-skip_frame', 'nokey',
+                           '-i', inp_path.as_posix(),
+                           '-map', '0:v:0',
+                           '-vf', f'fps=1/{interval},{thumbnail},tile={columns}x{rows}',
+                           '-q:v', '5',
+                           f'{output_dir}/sprite-%03d.jpg'))
+
+    Path(output_dir, 'trickplay.vtt').write_text(trickplay_vtt(media["duration"], interval, width, height, columns, rows))
+
+
+# Per-title encoding: short samples of the source are trial-encoded at a few
+# CRF values per rendition, and every rendition gets the lowest bitrate that
+# still reaches the target quality instead of the fixed bitrate of its profile.
+
+TRIAL_CRFS = (22, 26, 30, 34)
+
+# quality every rendition has to reach, VMAF is used when ffmpeg has it
+QUALITY_TARGETS = {"vmaf": 93, "ssim": 0.97}
+
+
+def has_filter(name: str) -> bool:
+    result = subprocess.run(('ffmpeg', '-hide_banner', '-filters'), stdout=subprocess.PIPE, text=True, check=True)
+    return any(line.split()[1:2] == [name] for line in result.stdout.splitlines())
+
+
+def sample_times(duration: float, samples: int, seconds: int) -> list:
+    # spread the samples evenly, away from the start and end of the video
+    if duration <= seconds:
+        return [0.0]
+    return [(duration - seconds) * (k + 1) / (samples + 1) for k in range(samples)]
+
+
+def measure_quality(encoded: Path, inp_path: Path, start: float, seconds: int, prof: HlsProfile, metric: str, projection: str, source_projection: str) -> float:
+    """
+    Compares an encoded sample with the same part of the source, scaled
+    (and reprojected) like the rendition
+    """
+    reference = ladder_filter([prof], '1:v:0', projection, source_projection)
+    if metric == "vmaf":
+        compare, pattern = '[0:v:0][v0]libvmaf', r'VMAF score: ([\d.]+)'
+    else:
+        compare, pattern = '[0:v:0][v0]ssim', r'All:([\d.]+)'
+
+    result = subprocess.run(('ffmpeg', '-hide_banner',
+                             '-i', encoded.as_posix(),
+                             '-ss', str(start), '-t', str(seconds), '-i', inp_path.as_posix(),
+                             '-lavfi', f'{reference};{compare}',
+                             '-f', 'null', '-'),
+                            stderr=subprocess.PIPE, text=True, check=True)
+    return float(re.findall(pattern, result.stderr)[-1])
+
+
+def trial_encode(inp_path: Path, work_dir: Path, start: float, seconds: int, profiles, crf: int, projection: str, source_projection: str) -> list:
+    """
+    Encodes a sample of the source at `crf` into every rendition in one
+    pass, returns the paths of the encoded samples
+    """
+    outputs = [Path(work_dir, f'trial-{start:.0f}-{crf}-v{i}.mp4') for i, _ in enumerate(profiles)]
+    args = ('ffmpeg', '-hide_banner', '-y',
+            '-ss', str(start), '-t', str(seconds), '-i', inp_path.as_posix(),
+            '-filter_complex', ladder_filter(profiles, projection=projection, source_projection=source_projection))
+    for i, output in enumerate(outputs):
+        args += ('-map', f'[v{i}]', '-c:v', 'libx264', '-preset', 'veryfast', '-crf', str(crf), output.as_posix())
     subprocess.check_call(args)
+    return outputs
+
+
+def per_title_ladder(inp_path: Path, ladder, media: dict, samples: int = 3, seconds: int = 4, projection: str = "equirectangular", source_projection: str = "equirectangular", headroom: float = 1.2) -> list:
+    """
+    Lowers the bitrate of every rendition of `ladder` to what the content
+    needs to reach the quality target. The bitrate of the highest CRF that
+    reaches the target on average over the samples is used, with some
+    headroom because the stream is encoded at a constrained bitrate. The
+    bitrates of the ladder are never exceeded.
+    """
+    profiles = [replace(prof, copy=False) for prof in ladder]
+    metric = "vmaf" if has_filter("libvmaf") else "ssim"
+    starts = sample_times(media["duration"], samples, seconds)
+
+    # measurements[i][crf] = [(kbit/s, quality) per sample]
+    measurements = [{crf: [] for crf in TRIAL_CRFS} for _ in profiles]
+    with tempfile.TemporaryDirectory() as work_dir:
+        for start in starts:
+            length = min(seconds, media["duration"] - start)
+            for crf in TRIAL_CRFS:
+                outputs = trial_encode(inp_path, Path(work_dir), start, seconds, profiles, crf, projection, source_projection)
+                for i, (prof, output) in enumerate(zip(profiles, outputs)):
+                    kbits = output.stat().st_size * 8 / 1000 / length
+                    quality = measure_quality(output, inp_path, start, seconds, prof, metric, projection, source_projection)
+                    measurements[i][crf].append((kbits, quality))
+
+    result = []
+    for prof, by_crf in zip(ladder, measurements):
+        bitrate = prof.video_bitrate
+        for crf in sorted(TRIAL_CRFS, reverse=True):
+            kbits = sum(kbit for kbit, _ in by_crf[crf]) / len(by_crf[crf])
+            quality = sum(quality for _, quality in by_crf[crf]) / len(by_crf[crf])
+            if quality >= QUALITY_TARGETS[metric]:
+                bitrate = min(prof.video_bitrate, math.ceil(kbits * headroom))
+                break
+        result.append(replace(prof, video_bitrate=bitrate))
+    return result
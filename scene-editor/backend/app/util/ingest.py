@@ -0,0 +1,707 @@
+import os
+import time
+import shutil
+import itertools
+from pathlib import Path
+from datetime import datetime, timedelta
+from dataclasses import asdict, fields, replace
+
+from app.models.database import db
+from app.models.asset import Asset as AssetModel, AssetType, AssetStatus, Projection, ViewType
+from app.models.annotation import Annotation as AnnotationModel
+from app.models.upload import Upload as UploadModel
+from app.models.project import Project as ProjectModel
+from app.models.scene import Scene as SceneModel
+
+from app.util.ffmpeg import create_thumbnail, probe, detect_stereo, select_stereo_ladder, per_title_ladder, add_codecs, projected_size, needs_reprojection, PROBED_PROJECTIONS, remux_matching_rendition, playlist_name, create_hls, create_hls_parallel, create_hls_progressive, encode_renditions, playlist_boundaries, write_master_playlist, split_source, stitch_hls, encoded_chunk_path, create_tiles, create_trickplay, segment_boundaries, HlsProfile, HLS_PROFILES, SEGMENT_SECONDS
+from app.util.jobs import enqueue, job_pending, publish_progress, set_upload_received, abort_upload
+from app.util.stream import streamable, upload_stream, download, hash_file
+import app.util.util as util
+from app.config import UPLOAD_MAX_SIZE, UPLOAD_EXPIRY, UPLOAD_STREAMING, UPLOAD_STREAM_HEADER_SIZE, INTERACTIVE_QUEUE, IMPORT_QUEUE, ASSET_DIR, HLS_SEGMENT_TYPE, HLS_REMUX, HLS_TILES, HLS_PROJECTION, TRICKPLAY_INTERVAL, HLS_INITIAL_SEGMENTS, HLS_PROGRESSIVE, PER_TITLE_ENCODING, HLS_CODECS, HLS_PARALLEL, HLS_CHUNK_SECONDS, HLS_PARALLEL_WORKERS, REPLACED_STREAM_TTL, MEDIA_THREADS
+
+
+def extension_to_type(extension):
+    try:
+        return {".mp4": AssetType.video,
+                ".webm": AssetType.video,
+                ".mkv": AssetType.video,
+                ".mov": AssetType.video,
+                ".glb": AssetType.model}[extension.lower()]
+    except KeyError:
+        return None
+
+
+def find_duplicate(user_id, content_hash: str, asset_type: AssetType, projection: str = None, source_projection: str = None):
+    """
+    Returns an asset of the user with the given content that was, or is
+    being, processed the same way, or None
+    """
+    query = AssetModel.query.filter(AssetModel.user_id == user_id,
+                                    AssetModel.content_hash == content_hash,
+                                    AssetModel.asset_type == asset_type,
+                                    AssetModel.status != AssetStatus.failed)
+    if asset_type == AssetType.video:
+        query = query.filter(AssetModel.projection == Projection[projection or HLS_PROJECTION])
+        if source_projection is not None:
+            query = query.filter(AssetModel.source_projection == source_projection)
+    return query.order_by(AssetModel.created_at).first()
+
+
+def link_asset(asset: AssetModel, project) -> None:
+    if project not in asset.projects:
+        asset.projects.append(project)
+    db.session.commit()
+
+
+def create_asset(project, asset_name: str, asset_type: AssetType, base_name: str, raw_video_path: Path, content_hash: str = None, projection: str = None, source_projection: str = None, upload=None):
+    """
+    Creates the asset row for an uploaded file that was written to
+    `raw_video_path`. Videos are created in the processing state and are
+    transcoded by a job on the worker, other assets are ready right away.
+    Videos are transcoded to `projection`, HLS_PROJECTION by default, from
+    `source_projection`, which is detected when probing if not given. With
+    an `upload` in progress the file is still being written, see
+    `stream_upload`. A file the user uploaded before is not stored again,
+    the existing asset is added to the project instead and returned.
+    """
+    duplicate = find_duplicate(project.user_id, content_hash, asset_type, projection, source_projection) if content_hash else None
+    if duplicate is not None:
+        raw_video_path.unlink(missing_ok=True)
+        link_asset(duplicate, project)
+        return duplicate
+
+    file_size = upload.size if upload is not None else os.path.getsize(raw_video_path)
+    row = AssetModel(name=asset_name, user_id=project.user_id, asset_type=asset_type, source_path=raw_video_path.name, file_size=file_size, content_hash=content_hash,
+                     projection=Projection[projection or HLS_PROJECTION], source_projection=source_projection, projects=[project])
+
+    if asset_type != AssetType.video:
+        row.path = raw_video_path.name
+        row.status = AssetStatus.ready
+        db.session.commit()
+        return row
+
+    row.status = AssetStatus.processing
+    if upload is not None:
+        # in the same transaction, so no other chunk starts a second asset
+        db.session.flush()
+        upload.asset_id = row.id
+    db.session.commit()
+
+    if upload is not None:
+        row.job_id = enqueue('app.tasks.stream_asset', str(row.id), str(upload.id)).id
+    else:
+        row.job_id = enqueue('app.tasks.inspect_asset', str(row.id), queue=INTERACTIVE_QUEUE).id
+    db.session.commit()
+    publish_progress(row.id, {"state": "queued"})
+
+    return row
+
+
+# view types of the stereo layouts found by `detect_stereo`
+VIEW_TYPES = {
+    "mono": ViewType.mono,
+    "top_bottom": ViewType.toptobottom,
+    "side_by_side": ViewType.sidetoside,
+}
+STEREO_LAYOUTS = {view_type: layout for layout, view_type in VIEW_TYPES.items()}
+
+
+def ladder_to_renditions(ladder, playlists=None) -> list:
+    if playlists is None:
+        playlists = [playlist_name(i, HLS_SEGMENT_TYPE) for i in range(len(ladder))]
+    return [{"playlist": playlist, **asdict(prof)} for playlist, prof in zip(playlists, ladder)]
+
+
+def ladder_of(asset: AssetModel) -> list:
+    """
+    Returns the HLS profiles of the renditions recorded on the asset
+    """
+    names = [field.name for field in fields(HlsProfile)]
+    return [HlsProfile(**{name: rendition[name] for name in names if name in rendition})
+            for rendition in asset.renditions]
+
+
+def probe_asset(asset: AssetModel) -> dict:
+    """
+    Returns the media info of the source of the asset. Probing is skipped if
+    a file with the same content was probed before.
+    """
+    if asset.content_hash is not None:
+        probed = AssetModel.query.filter(AssetModel.content_hash == asset.content_hash,
+                                         AssetModel.media_info.isnot(None),
+                                         AssetModel.id != asset.id).first()
+        if probed is not None:
+            return probed.media_info
+
+    return probe(Path(ASSET_DIR, asset.source_path))
+
+
+def inspect_video(asset: AssetModel, partial: Path = None) -> None:
+    """
+    Probes the source of a video asset, detects its stereo layout and
+    creates its thumbnail. This is what the editor needs to show the asset,
+    so it runs as a short job ahead of the transcode. All later steps use the
+    stored media info instead of probing the source again. Of the `partial`
+    file of an upload in progress only the header is used.
+    """
+    media = asset.media_info = probe(partial) if partial is not None else probe_asset(asset)
+    if media["width"] is None or not media["duration"]:
+        raise ValueError(f"{asset.source_path} does not contain a video stream")
+
+    asset.duration = int(media["duration"])
+
+    if asset.source_projection is None:
+        asset.source_projection = PROBED_PROJECTIONS.get(media["projection"], "equirectangular")
+
+    raw_video_path = partial or Path(ASSET_DIR, asset.source_path)
+
+    # the halves of other projections are different parts of the sphere anyway
+    compare_halves = partial is None and asset.source_projection == "equirectangular"
+    asset.view_type = VIEW_TYPES[detect_stereo(raw_video_path, media, compare_halves)]
+
+    if partial is None:
+        thumbnail_video(asset, raw_video_path)
+
+
+def thumbnail_video(asset: AssetModel, raw_video_path: Path) -> None:
+    base_name, _ = os.path.splitext(asset.source_path)
+    thumbnail_path = Path(ASSET_DIR, base_name + '.jpg')
+    if create_thumbnail(raw_video_path.as_posix(), thumbnail_path.as_posix(), at=min(1, asset.media_info["duration"] / 2)):
+        asset.thumbnail_path = thumbnail_path.name
+
+
+def trickplay_video(asset: AssetModel, raw_video_path: Path) -> None:
+    if TRICKPLAY_INTERVAL:
+        trickplay_dir = Path(hls_output_dir(asset), 'trickplay')
+        trickplay_dir.mkdir(exist_ok=True)
+        create_trickplay(raw_video_path, trickplay_dir, asset.media_info, TRICKPLAY_INTERVAL, source_projection=asset.source_projection)
+        asset.trickplay_path = f'{trickplay_dir.parent.name}/trickplay/trickplay.vtt'
+
+
+def prepare_video(asset: AssetModel, streaming: bool = False) -> None:
+    """
+    Creates the trickplay sprites of a video asset and selects the
+    renditions to encode, at the bitrates the content needs when per-title
+    encoding is enabled. A rendition that matches the source is copied
+    instead of encoded. The video is inspected first if it was not yet.
+    When `streaming` from an upload in progress only the ladder is chosen,
+    the other steps need the whole source.
+    """
+    if asset.media_info is None:
+        inspect_video(asset)
+    media = asset.media_info
+
+    asset.cue_points = cue_points(asset)
+
+    raw_video_path = Path(ASSET_DIR, asset.source_path)
+
+    if not streaming:
+        trickplay_video(asset, raw_video_path)
+
+    # v360 would treat a stereo frame as a single view
+    if asset.view_type != ViewType.mono and needs_reprojection(asset.projection.name, asset.source_projection):
+        raise ValueError(f"{asset.source_path} is stereoscopic and can not be reprojected")
+
+    ladder = target_ladder(asset, PER_TITLE_ENCODING and not streaming)
+    # a copied rendition keeps the keyframes of the source, planned segments need their own
+    if HLS_REMUX and asset.projection == Projection.equirectangular and asset.source_projection == "equirectangular" \
+            and boundaries_of(asset) is None and not streaming:
+        ladder = remux_matching_rendition(ladder, media, raw_video_path)
+    asset.renditions = ladder_to_renditions(ladder)
+
+
+def target_ladder(asset: AssetModel, per_title: bool = False) -> list:
+    """
+    The renditions HLS_PROFILES give for the video, at the bitrates the
+    content needs if `per_title` is set
+    """
+    media = asset.media_info
+    width, height = projected_size(media["width"], media["height"], asset.projection.name, asset.source_projection)
+    ladder = select_stereo_ladder(HLS_PROFILES, width, height, STEREO_LAYOUTS[asset.view_type], media["video_bitrate"])
+    if per_title:
+        ladder = per_title_ladder(Path(ASSET_DIR, asset.source_path), ladder, media, projection=asset.projection.name, source_projection=asset.source_projection)
+    # TS segments can only carry H.264
+    return add_codecs(ladder, HLS_CODECS if HLS_SEGMENT_TYPE == "fmp4" else ["h264"])
+
+
+def cue_points(asset: AssetModel) -> list:
+    """
+    The distinct annotation timestamps of the scenes that use the video,
+    where playback has to be able to start without delay
+    """
+    timestamps = db.session.query(AnnotationModel.timestamp) \
+                           .join(SceneModel, SceneModel.id == AnnotationModel.scene_id) \
+                           .filter(SceneModel.video_id == asset.id, AnnotationModel.timestamp.isnot(None)) \
+                           .distinct()
+    duration = asset.media_info["duration"] if asset.media_info else asset.duration or 0
+    return sorted(timestamp for (timestamp,) in timestamps if 0 < timestamp < duration)
+
+
+def boundaries_of(asset: AssetModel):
+    """
+    The planned segment boundaries of the asset, None if segments are cut
+    at regular intervals
+    """
+    if not asset.cue_points and not HLS_INITIAL_SEGMENTS:
+        return None
+    return segment_boundaries(asset.media_info["duration"], asset.cue_points or [], initial=HLS_INITIAL_SEGMENTS)
+
+
+def progressive() -> bool:
+    # publishing renditions one by one needs the playlists written by separate outputs
+    return HLS_PROGRESSIVE and HLS_PARALLEL == "" and HLS_SEGMENT_TYPE == "mpegts"
+
+
+def hls_output_dir(asset: AssetModel) -> Path:
+    """
+    The directory of the HLS stream of a video: the one its main.m3u8 is
+    published in, or the directory named after the source before that
+    """
+    if asset.path is not None and asset.path.endswith('/main.m3u8'):
+        return Path(ASSET_DIR, asset.path).parent
+    base_name, _ = os.path.splitext(asset.source_path)
+    output_dir = Path(ASSET_DIR, base_name)
+    output_dir.mkdir(exist_ok=True)
+    return output_dir
+
+
+def set_stream_paths(asset: AssetModel, output_dir: Path) -> None:
+    asset.path = output_dir.name + '/main.m3u8'
+    asset.dash_path = output_dir.name + '/main.mpd' if HLS_SEGMENT_TYPE == "fmp4" else None
+
+
+def process_video(asset: AssetModel, progress=None) -> None:
+    """
+    Creates the thumbnail and HLS stream of a video asset. The asset only
+    gets a playable path once its first rendition is done, it stays in the
+    processing state until all are. `progress` is called with the progress
+    reports of the transcode.
+    """
+    prepare_video(asset)
+
+    raw_video_path = Path(ASSET_DIR, asset.source_path)
+    output_dir = hls_output_dir(asset)
+
+    def published():
+        set_stream_paths(asset, output_dir)
+        db.session.commit()
+        if progress is not None:
+            progress({"state": "running", "playable": True})
+
+    # a copied rendition keeps the keyframes of the source, which the
+    # separately encoded renditions would not line up with; copying it is
+    # faster than publishing the lowest rendition first anyway
+    if progressive() and not any(prof.copy for prof in ladder_of(asset)):
+        create_hls_progressive(raw_video_path, output_dir, ladder_of(asset), asset.media_info, progress, asset.projection.name, asset.source_projection, boundaries_of(asset), published, MEDIA_THREADS)
+    elif HLS_PARALLEL == "pool":
+        create_hls_parallel(raw_video_path, output_dir, HLS_CHUNK_SECONDS, HLS_PARALLEL_WORKERS, ladder_of(asset), asset.media_info, progress, HLS_SEGMENT_TYPE, asset.projection.name, asset.source_projection, boundaries_of(asset), MEDIA_THREADS)
+    else:
+        create_hls(raw_video_path, output_dir, ladder_of(asset), asset.media_info, progress, HLS_SEGMENT_TYPE, asset.projection.name, asset.source_projection, boundaries_of(asset), MEDIA_THREADS)
+
+    set_stream_paths(asset, output_dir)
+    tile_video(asset, progress)
+
+
+def partial_path(upload) -> Path:
+    # where the chunks of an upload are written until it is finalized
+    return Path(ASSET_DIR, upload.file_name + '.part')
+
+
+def expire_uploads() -> None:
+    """
+    Removes the uploads that received no chunk for UPLOAD_EXPIRY seconds,
+    with their partial files. The transcode of a video that started during
+    such an upload fails, unless all of it arrived: the file is then kept as
+    the source of the asset, as if the upload was finalized.
+    """
+    expired = UploadModel.query.filter(UploadModel.updated_at < datetime.now() - timedelta(seconds=UPLOAD_EXPIRY)).all()
+    for upload in expired:
+        if upload.asset_id is not None and upload.complete and partial_path(upload).exists():
+            partial_path(upload).rename(Path(ASSET_DIR, upload.file_name))
+        else:
+            abort_upload(upload.id)
+            partial_path(upload).unlink(missing_ok=True)
+        db.session.delete(upload)
+    db.session.commit()
+
+
+def ingest_upload(upload) -> None:
+    """
+    Hashes a finalized upload and turns it into an asset, or links the
+    asset the user uploaded before with the same content (see
+    `create_asset`). The asset is recorded on the upload, which stays
+    around for the client until it expires. A video that was transcoded
+    while it was uploaded only gets its hash.
+    """
+    base_name, extension = os.path.splitext(upload.file_name)
+    raw_video_path = Path(ASSET_DIR, upload.file_name)
+    content_hash = hash_file(raw_video_path)
+
+    if upload.asset_id is not None:
+        AssetModel.query.filter_by(id=upload.asset_id).update({"content_hash": content_hash})
+    else:
+        project = ProjectModel.query.filter_by(id=upload.project_id).first()
+        row = create_asset(project, upload.name, extension_to_type(extension), base_name, raw_video_path, content_hash, upload.projection, upload.source_projection)
+        upload.asset_id = row.id
+    db.session.commit()
+
+
+def stream_upload(upload, project) -> None:
+    """
+    Called for every chunk of an upload. Publishes how much of the start of
+    the file has arrived, and creates the asset of a video once its header
+    is in and it can be read in order, so it is transcoded while the rest is
+    uploaded. Other uploads are transcoded once they are finalized.
+    """
+    received = upload.received[0][1] if upload.received and upload.received[0][0] == 0 else 0
+    set_upload_received(upload.id, received)
+
+    _, extension = os.path.splitext(upload.file_name)
+    if not UPLOAD_STREAMING or upload.asset_id is not None or upload.complete or extension_to_type(extension) != AssetType.video:
+        return
+    if received < min(upload.size, UPLOAD_STREAM_HEADER_SIZE) or not streamable(partial_path(upload), received, extension):
+        return
+
+    base_name, _ = os.path.splitext(upload.file_name)
+    create_asset(project, upload.name, AssetType.video, base_name, Path(ASSET_DIR, upload.file_name), None, upload.projection, upload.source_projection, upload)
+
+
+def import_asset(project, asset_name: str, url: str, extension: str, sha256: str = None, projection: str = None, source_projection: str = None):
+    """
+    Creates the asset row for a file that is imported from `url` and
+    enqueues the job that downloads it, see `download_source`
+    """
+    asset_type = extension_to_type(extension)
+    row = AssetModel(name=asset_name, user_id=project.user_id, asset_type=asset_type, source_path=util.random_file_name() + extension,
+                     projection=Projection[projection or HLS_PROJECTION], source_projection=source_projection, projects=[project])
+    row.status = AssetStatus.processing
+    db.session.commit()
+
+    # a worker of its own downloads, so a video can be transcoded while it downloads
+    row.job_id = enqueue('app.tasks.import_asset', str(row.id), url, sha256, queue=IMPORT_QUEUE).id
+    db.session.commit()
+    publish_progress(row.id, {"state": "queued"})
+
+    return row
+
+
+# seconds between progress reports of a download
+DOWNLOAD_PROGRESS_INTERVAL = 1
+
+
+def download_source(asset: AssetModel, url: str, sha256: str = None, progress=None) -> None:
+    """
+    Downloads the source of an imported asset. Like an upload, a video that
+    can be read in order is transcoded while it downloads (see
+    `stream_upload`), other videos are processed once the download is done.
+    Other assets are ready once downloaded.
+    """
+    raw_video_path = Path(ASSET_DIR, asset.source_path)
+    partial = raw_video_path.with_name(raw_video_path.name + '.part')
+    _, extension = os.path.splitext(raw_video_path.name)
+    streaming = False
+    reported = 0
+
+    def received(offset, size):
+        nonlocal streaming, reported
+        set_upload_received(asset.id, offset)
+
+        if progress is not None and time.monotonic() - reported > DOWNLOAD_PROGRESS_INTERVAL:
+            progress({"state": "running", "downloaded": offset, "size": size})
+            reported = time.monotonic()
+
+        if streaming or not UPLOAD_STREAMING or asset.asset_type != AssetType.video or size is None:
+            return
+        if offset >= min(size, UPLOAD_STREAM_HEADER_SIZE) and streamable(partial, offset, extension):
+            asset.file_size = size
+            asset.job_id = enqueue('app.tasks.stream_asset', str(asset.id), str(asset.id)).id
+            db.session.commit()
+            streaming = True
+
+    asset.file_size, asset.content_hash = download(url, partial, UPLOAD_MAX_SIZE, sha256, received)
+    partial.rename(raw_video_path)
+
+    if asset.asset_type != AssetType.video:
+        asset.path = raw_video_path.name
+    elif not streaming:
+        asset.job_id = enqueue('app.tasks.inspect_asset', str(asset.id), queue=INTERACTIVE_QUEUE).id
+    db.session.commit()
+
+
+def stream_video(asset: AssetModel, upload_id, progress=None) -> None:
+    """
+    Transcodes a video while it is being uploaded or downloaded, `upload_id`
+    being the upload or the imported asset: ffmpeg reads the upload
+    through a FIFO as its bytes arrive, in a single pass. The steps that
+    need the whole source (thumbnail, trickplay, tiles) follow in
+    `finish_streamed_video`, by then the upload is complete.
+    """
+    raw_video_path = Path(ASSET_DIR, asset.source_path)
+    partial = raw_video_path.with_name(raw_video_path.name + '.part')
+
+    inspect_video(asset, partial if partial.exists() else raw_video_path)
+    prepare_video(asset, streaming=True)
+    db.session.commit()
+
+    output_dir = hls_output_dir(asset)
+    with upload_stream(upload_id, [partial, raw_video_path], asset.file_size) as source:
+        create_hls(source, output_dir, ladder_of(asset), asset.media_info, progress, HLS_SEGMENT_TYPE, asset.projection.name, asset.source_projection, boundaries_of(asset), MEDIA_THREADS)
+    set_stream_paths(asset, output_dir)
+
+
+def finish_streamed_video(asset: AssetModel, progress=None) -> None:
+    """
+    Creates the thumbnail, trickplay and tiles of a video that was
+    transcoded by `stream_video`
+    """
+    raw_video_path = Path(ASSET_DIR, asset.source_path)
+    partial = raw_video_path.with_name(raw_video_path.name + '.part')
+
+    # the upload may not be finalized yet
+    complete_path = raw_video_path if raw_video_path.exists() else partial
+    thumbnail_video(asset, complete_path)
+    trickplay_video(asset, complete_path)
+    tile_video(asset, progress, complete_path)
+
+
+def split_video(asset: AssetModel) -> list:
+    """
+    First step of a distributed transcode: cuts the source of the asset into
+    chunks that can be encoded by separate jobs with `encode_chunk`
+    """
+    work_dir = Path(hls_output_dir(asset), 'chunks')
+    work_dir.mkdir(exist_ok=True)
+    return split_source(Path(ASSET_DIR, asset.source_path), work_dir, HLS_CHUNK_SECONDS)
+
+
+def stitch_video(asset: AssetModel, chunks: list, progress=None) -> None:
+    """
+    Last step of a distributed transcode: stitches the encoded chunks into
+    the HLS stream of the asset
+    """
+    missing = [chunk for chunk in chunks if not encoded_chunk_path(chunk, 0).exists()]
+    if missing:
+        raise RuntimeError(f"Chunks were not encoded: {', '.join(chunk.name for chunk in missing)}")
+
+    output_dir = hls_output_dir(asset)
+    stitch_hls(Path(ASSET_DIR, asset.source_path), chunks, output_dir, ladder_of(asset), asset.media_info, progress, HLS_SEGMENT_TYPE, boundaries_of(asset))
+    shutil.rmtree(Path(output_dir, 'chunks'))
+
+    set_stream_paths(asset, output_dir)
+    tile_video(asset, progress)
+
+
+def tile_video(asset: AssetModel, progress=None, raw_video_path: Path = None) -> None:
+    """
+    Encodes the renditions of the asset as tiles for viewport adaptive
+    streaming, when HLS_TILES is set. Only monoscopic equirectangular videos
+    are tiled, using the H.264 renditions. The source is read from
+    `raw_video_path` if given.
+    """
+    media = asset.media_info
+    if not HLS_TILES or asset.projection != Projection.equirectangular or asset.view_type != ViewType.mono:
+        return
+
+    columns, rows = (int(n) for n in HLS_TILES.lower().split('x'))
+    tiles_dir = Path(hls_output_dir(asset), 'tiles')
+    tiles_dir.mkdir(exist_ok=True)
+    profiles = [prof for prof in ladder_of(asset) if prof.codec == "h264"]
+    create_tiles(raw_video_path or Path(ASSET_DIR, asset.source_path), tiles_dir, columns, rows, profiles, media, progress, asset.source_projection, MEDIA_THREADS)
+
+    asset.tiles_path = f'{tiles_dir.parent.name}/tiles/tiles.json'
+
+
+def schedule_resegment(video_id) -> None:
+    """
+    Enqueues a job that segments the video again when the annotation
+    timestamps of the scenes that use it no longer match its segments
+    """
+    asset = AssetModel.query.filter_by(id=video_id).first() if video_id else None
+    if asset is None or asset.status != AssetStatus.ready or asset.source_path is None:
+        return
+
+    # a job that has not started yet picks up the latest timestamps
+    if not needs_resegment(asset) or job_pending(asset.job_id, 'app.tasks.resegment_asset'):
+        return
+
+    # the job that processed the asset is reported again if the resegment fails
+    asset.job_id = enqueue('app.tasks.resegment_asset', str(asset.id), asset.job_id).id
+    db.session.commit()
+
+
+def needs_resegment(asset: AssetModel) -> bool:
+    return cue_points(asset) != (asset.cue_points or [])
+
+
+def probe_existing(asset: AssetModel) -> None:
+    """
+    Fills in the media info and source projection of videos from before they
+    were stored. Their view type was set by hand and is kept.
+    """
+    if asset.media_info is None:
+        asset.media_info = probe_asset(asset)
+    if asset.source_projection is None:
+        asset.source_projection = PROBED_PROJECTIONS.get(asset.media_info["projection"], "equirectangular")
+
+
+def segmented_at(asset: AssetModel, boundaries) -> bool:
+    """
+    Whether the segments of the current stream of a video start at the
+    planned `boundaries`, or are cut at regular intervals if they are None
+    """
+    playlist = asset.renditions[0]["playlist"] if asset.renditions else playlist_name(0, HLS_SEGMENT_TYPE)
+    path = Path(hls_output_dir(asset), playlist)
+    if not path.exists():
+        return False
+
+    current = playlist_boundaries(path)
+    # keyframes are forced on the first frame at or after a boundary
+    tolerance = 1 / (asset.media_info.get("fps") or 25) + 0.001
+    if boundaries is None:
+        # regular segments end at the first keyframe after SEGMENT_SECONDS
+        return all(end - start >= SEGMENT_SECONDS - tolerance for start, end in zip(current, current[1:]))
+    return len(current) == len(boundaries) and all(abs(a - b) <= tolerance for a, b in zip(current, boundaries))
+
+
+def resegment_video(asset: AssetModel, progress=None, ladder=None) -> None:
+    """
+    Transcodes a ready video again with segments that start at the current
+    annotation timestamps, with the renditions of `ladder` if given. Without
+    a `ladder` nothing is encoded when the segments already start there. The
+    new stream is written to a directory of its own and published when it
+    is done; the current one is removed after REPLACED_STREAM_TTL, so
+    players that are still playing it can finish.
+    """
+    probe_existing(asset)
+    asset.cue_points = cue_points(asset)
+    if ladder is None:
+        if segmented_at(asset, boundaries_of(asset)):
+            return
+        # videos from before the renditions were stored get the configured ladder
+        ladder = ladder_of(asset) if asset.renditions else target_ladder(asset)
+    ladder = [replace(prof, copy=False) for prof in ladder]
+
+    output_dir = hls_output_dir(asset)
+    base_name, _ = os.path.splitext(asset.source_path)
+    new_dir = Path(ASSET_DIR, f'{base_name}-{int(time.time())}')
+    new_dir.mkdir()
+
+    try:
+        create_hls(Path(ASSET_DIR, asset.source_path), new_dir, ladder, asset.media_info, progress, HLS_SEGMENT_TYPE, asset.projection.name, asset.source_projection, boundaries_of(asset), MEDIA_THREADS)
+
+        # trickplay and tiles do not depend on the segments, they are linked
+        # so the current stream keeps them
+        for name in ('trickplay', 'tiles'):
+            if Path(output_dir, name).exists():
+                shutil.copytree(Path(output_dir, name), Path(new_dir, name), copy_function=os.link)
+    except Exception:
+        shutil.rmtree(new_dir, ignore_errors=True)
+        raise
+
+    asset.renditions = ladder_to_renditions(ladder)
+    set_stream_paths(asset, new_dir)
+    if asset.trickplay_path is not None:
+        asset.trickplay_path = f'{new_dir.name}/trickplay/trickplay.vtt'
+    if asset.tiles_path is not None:
+        asset.tiles_path = f'{new_dir.name}/tiles/tiles.json'
+    db.session.commit()
+
+    enqueue('app.tasks.remove_stream', output_dir.name, queue=INTERACTIVE_QUEUE, delay=REPLACED_STREAM_TTL)
+
+
+def remove_replaced_stream(name: str) -> None:
+    # a stream directory that was replaced by `resegment_video`
+    shutil.rmtree(Path(ASSET_DIR, name), ignore_errors=True)
+
+
+def rendition_key(prof: HlsProfile) -> tuple:
+    # renditions of the same size and codec are the same rung, whatever their bitrate
+    return prof.width, prof.height, prof.codec
+
+
+def ladder_diff(asset: AssetModel) -> tuple:
+    """
+    Compares the renditions of a video with the ladder HLS_PROFILES give for
+    it. Returns the configured ladder, its profiles that were not encoded
+    and the numbers of the renditions that are no longer configured.
+    """
+    current = ladder_of(asset) if asset.renditions else []
+    ladder = target_ladder(asset)
+    current_keys = {rendition_key(prof) for prof in current}
+    ladder_keys = {rendition_key(prof) for prof in ladder}
+    missing = [prof for prof in ladder if rendition_key(prof) not in current_keys]
+    removed = [i for i, prof in enumerate(current) if rendition_key(prof) not in ladder_keys]
+    return ladder, missing, removed
+
+
+def schedule_reladder() -> list:
+    """
+    Enqueues a job for every ready video whose renditions differ from
+    HLS_PROFILES, after the ladder was changed. Returns the ids of the
+    assets.
+    """
+    assets = AssetModel.query.filter(AssetModel.asset_type == AssetType.video,
+                                     AssetModel.status == AssetStatus.ready,
+                                     AssetModel.source_path.isnot(None)).all()
+    scheduled = []
+    for asset in assets:
+        # videos from before probing was stored are inspected by the job
+        if asset.media_info is not None:
+            _, missing, removed = ladder_diff(asset)
+            if not missing and not removed:
+                continue
+        asset.job_id = enqueue('app.tasks.reladder_asset', str(asset.id)).id
+        scheduled.append(asset.id)
+    db.session.commit()
+    return scheduled
+
+
+def reladder_video(asset: AssetModel, progress=None) -> None:
+    """
+    Brings the renditions of a ready video in line with HLS_PROFILES. Only
+    the missing rungs are encoded, with segments that line up with the
+    existing renditions, then main.m3u8 is replaced and the rungs that are
+    no longer configured are deleted. Streams with fMP4 segments are
+    transcoded again as a whole, as their DASH manifest describes all
+    renditions together.
+    """
+    probe_existing(asset)
+    media = asset.media_info
+
+    current = ladder_of(asset) if asset.renditions else []
+    ladder, missing, removed = ladder_diff(asset)
+    if not missing and not removed:
+        return
+
+    if asset.dash_path is not None or HLS_SEGMENT_TYPE != "mpegts" or len(removed) == len(current):
+        resegment_video(asset, progress, target_ladder(asset, PER_TITLE_ENCODING))
+        return
+
+    raw_video_path = Path(ASSET_DIR, asset.source_path)
+    output_dir = hls_output_dir(asset)
+    playlists = [rendition["playlist"] for rendition in asset.renditions]
+
+    if PER_TITLE_ENCODING and missing:
+        missing = per_title_ladder(raw_video_path, missing, media, projection=asset.projection.name, source_projection=asset.source_projection)
+
+    # new renditions never take the name of a current one, players may still load the removed ones
+    free = (n for n in itertools.count() if playlist_name(n) not in playlists)
+    names = [next(free) for _ in missing]
+    if missing:
+        kept = next(i for i in range(len(current)) if i not in removed)
+        boundaries = playlist_boundaries(Path(output_dir, playlists[kept]))
+        encode_renditions(raw_video_path, output_dir, missing, list(range(len(missing))), media, progress, asset.projection.name, asset.source_projection, boundaries, audio=False, names=names, threads=MEDIA_THREADS)
+
+    renditions = {rendition_key(prof): (prof, playlist) for prof, playlist in zip(current, playlists)}
+    renditions.update((rendition_key(prof), (prof, playlist_name(n))) for prof, n in zip(missing, names))
+    ladder, ladder_playlists = zip(*(renditions[rendition_key(prof)] for prof in ladder))
+
+    write_master_playlist(output_dir, ladder, playlists=ladder_playlists)
+    asset.renditions = ladder_to_renditions(ladder, ladder_playlists)
+    db.session.commit()
+
+    # main.m3u8 and the asset no longer refer to them
+    for i in removed:
+        stem, _ = os.path.splitext(playlists[i])
+        for path in itertools.chain([Path(output_dir, playlists[i])], output_dir.glob(f'{stem}-s*.ts')):
+            path.unlink(missing_ok=True)
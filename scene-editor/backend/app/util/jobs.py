@@ -0,0 +1,237 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import threading
+import subprocess
+from datetime import timedelta
+from contextlib import contextmanager
+
+import redis
+
+from rq import Queue
+from rq.job import Job, JobStatus, Dependency
+from rq.exceptions import NoSuchJobError
+
+from app.config import REDIS_URL, BULK_QUEUE, JOB_TIMEOUT, PROGRESS_STREAM_TIMEOUT, MAX_CONCURRENT_ENCODES, MAX_CONCURRENT_STREAMS, MEDIA_HOST, MEDIA_THREADS, MEDIA_NICE, MEDIA_IO_CLASS
+
+connection = redis.from_url(REDIS_URL)
+
+
+def enqueue(func: str, *args, queue: str = BULK_QUEUE, depends_on=None, delay: int = None) -> Job:
+    """
+    Enqueues the function with the given import path (e.g.
+    'app.tasks.process_asset') so it is run by `app/worker.py`, on the bulk
+    queue unless another `queue` is given. Jobs listed in `depends_on` have
+    to finish, successfully or not, before it starts. A job with a `delay`
+    (seconds) is enqueued by the scheduler of a worker once it has passed.
+    """
+    if depends_on is not None:
+        depends_on = Dependency(jobs=depends_on, allow_failure=True)
+    if delay is not None:
+        return Queue(queue, connection=connection).enqueue_in(timedelta(seconds=delay), func, *args, job_timeout=JOB_TIMEOUT)
+    return Queue(queue, connection=connection).enqueue(func, *args, job_timeout=JOB_TIMEOUT, depends_on=depends_on)
+
+
+def job_status(job_id):
+    """
+    Returns the status of a job as either 'queued', 'running', 'failed' or
+    'done', or None if the job is not known (anymore).
+    """
+    if job_id is None:
+        return None
+
+    try:
+        status = Job.fetch(job_id, connection=connection).get_status()
+    except NoSuchJobError:
+        return None
+
+    if status == JobStatus.STARTED:
+        return "running"
+    if status == JobStatus.FINISHED:
+        return "done"
+    if status in (JobStatus.FAILED, JobStatus.STOPPED, JobStatus.CANCELED):
+        return "failed"
+    return "queued"
+
+
+def job_pending(job_id, func: str) -> bool:
+    """
+    Whether the job runs the function with the import path `func` (as given
+    to `enqueue`) and has not started yet
+    """
+    if job_id is None:
+        return False
+
+    try:
+        job = Job.fetch(job_id, connection=connection)
+    except NoSuchJobError:
+        return False
+
+    return job.func_name == func and job.get_status() in (JobStatus.QUEUED, JobStatus.DEFERRED, JobStatus.SCHEDULED)
+
+
+# ionice arguments per IO class
+IO_CLASSES = {
+    "best-effort": ('-c', '2', '-n', '7'),
+    "idle": ('-c', '3'),
+}
+# interval in seconds at which a job waiting for an encode slot checks again
+SLOT_POLL_INTERVAL = 5
+# seconds after which the slot of a job that died (OOM killed, timed out)
+# is free again; running jobs renew it at a third of that interval
+SLOT_TTL = 60
+
+
+def slot_key(slot: int, kind: str = "encode") -> str:
+    return f"host:{MEDIA_HOST}:{kind}:{slot}"
+
+
+def acquire_slot(kind: str = "encode", slots: int = MAX_CONCURRENT_ENCODES, token: str = None) -> int:
+    """
+    Waits until one of the `slots` slots of this host of the given `kind` is
+    free and takes it, marked with `token`. Slots expire after SLOT_TTL
+    unless they are renewed, see `renew_slot`.
+    """
+    while True:
+        for slot in range(slots):
+            if connection.set(slot_key(slot, kind), token or os.getpid(), nx=True, ex=SLOT_TTL):
+                return slot
+        time.sleep(SLOT_POLL_INTERVAL)
+
+
+def renew_slot(key: str, token: str, stopped: threading.Event) -> None:
+    # heartbeat of a running job, it ends with the work horse if that is killed
+    while not stopped.wait(SLOT_TTL / 3):
+        if connection.get(key) != token.encode():
+            break
+        connection.expire(key, SLOT_TTL)
+
+
+def limit_resources(slot: int) -> None:
+    """
+    Lowers the CPU and IO priority of the current process and binds it to
+    MEDIA_THREADS cores, different ones per slot where possible. Processes
+    started afterwards, like ffmpeg, inherit the limits; the encoders are
+    given MEDIA_THREADS threads as well, as not every library sizes its
+    thread pool by the cores it may use. RQ runs every job in a forked
+    work horse, so the limits end with the job. Calling it again in the same
+    job does not lower the priority further.
+    """
+    os.setpriority(os.PRIO_PROCESS, 0, max(MEDIA_NICE, os.getpriority(os.PRIO_PROCESS, 0)))
+
+    if MEDIA_IO_CLASS and shutil.which('ionice'):
+        subprocess.run(('ionice',) + IO_CLASSES[MEDIA_IO_CLASS] + ('-p', str(os.getpid())), check=False)
+
+    cpus = sorted(os.sched_getaffinity(0))
+    if 0 < MEDIA_THREADS < len(cpus):
+        start = slot * MEDIA_THREADS % len(cpus)
+        os.sched_setaffinity(0, (cpus * 2)[start:start + MEDIA_THREADS])
+
+
+@contextmanager
+def encode_slot(kind: str = "encode", slots: int = MAX_CONCURRENT_ENCODES):
+    """
+    Runs the body as one of the encodes of this host, with limited resources
+    """
+    token = uuid.uuid4().hex
+    slot = acquire_slot(kind, slots, token)
+    key = slot_key(slot, kind)
+
+    stopped = threading.Event()
+    heartbeat = threading.Thread(target=renew_slot, args=(key, token, stopped), daemon=True)
+    heartbeat.start()
+    try:
+        limit_resources(slot)
+        yield slot
+    finally:
+        stopped.set()
+        heartbeat.join()
+        # the slot may have expired and been taken by another job meanwhile
+        if connection.get(key) == token.encode():
+            connection.delete(key)
+
+
+def stream_slot():
+    """
+    Runs the body as one of the transcodes of uploads in progress of this
+    host, see `encode_slot`
+    """
+    return encode_slot("stream", MAX_CONCURRENT_STREAMS)
+
+
+def upload_key(upload_id) -> str:
+    return f"upload:{upload_id}:received"
+
+
+def set_upload_received(upload_id, received: int) -> None:
+    """
+    Records how many bytes from the start of an upload have been received,
+    for the job that transcodes it while it is in progress
+    """
+    connection.set(upload_key(upload_id), received, ex=JOB_TIMEOUT)
+
+
+def upload_received(upload_id):
+    # None once the upload was aborted
+    received = connection.get(upload_key(upload_id))
+    return int(received) if received is not None else None
+
+
+def abort_upload(upload_id) -> None:
+    connection.delete(upload_key(upload_id))
+
+
+# progress of an asset is kept for a day after its last update
+PROGRESS_TTL = 24 * 60 * 60
+# milliseconds after which the client's EventSource reconnects to a closed stream
+RECONNECT_INTERVAL = 1000
+
+
+def progress_key(asset_id) -> str:
+    return f"asset:{asset_id}:progress"
+
+
+def publish_progress(asset_id, report: dict) -> None:
+    """
+    Stores the latest progress report of an asset and notifies the
+    subscribers of its event stream
+    """
+    data = json.dumps(report)
+    connection.set(progress_key(asset_id), data, ex=PROGRESS_TTL)
+    connection.publish(progress_key(asset_id), data)
+
+
+def get_progress(asset_id):
+    data = connection.get(progress_key(asset_id))
+    return json.loads(data) if data is not None else None
+
+
+def progress_events(asset_id):
+    """
+    Yields server-sent events with the latest progress report of an asset
+    and the next one, as long-polling: the stream ends after the next report
+    or PROGRESS_STREAM_TIMEOUT, so it only holds a (synchronous) server
+    process for seconds, and the client's EventSource reconnects.
+    """
+    pubsub = connection.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(progress_key(asset_id))
+
+    try:
+        yield f"retry: {RECONNECT_INTERVAL}\n\n"
+
+        report = get_progress(asset_id)
+        if report is not None:
+            yield f"data: {json.dumps(report)}\n\n"
+            if report["state"] in ("done", "failed"):
+                return
+
+        deadline = time.monotonic() + PROGRESS_STREAM_TIMEOUT
+        while time.monotonic() < deadline:
+            message = pubsub.get_message(timeout=max(0, deadline - time.monotonic()))
+            if message is not None:
+                yield f"data: {json.dumps(json.loads(message['data']))}\n\n"
+                return
+    finally:
+        pubsub.close()
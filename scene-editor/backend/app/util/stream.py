@@ -0,0 +1,424 @@
+import os
+import time
+import errno
+import socket
+import struct
+import ipaddress
+import shutil
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
+from http import HTTPStatus
+from pathlib import Path
+from urllib.parse import urljoin, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from urllib3.util.connection import create_connection
+from flask import Request
+
+from app.util.util import BLOCK_SIZE, parse_content_range
+from app.util.jobs import upload_received
+from app.config import ASSET_DIR, UPLOAD_STALL_TIMEOUT
+
+# seconds between checks whether more of an upload in progress has arrived
+UPLOAD_POLL_INTERVAL = 1
+
+
+class HashingFile:
+    """
+    Temporary file in the asset directory that keeps track of the size and
+    SHA-256 of everything written to it. Used as the container for uploaded
+    files, so the multipart parser hashes the upload while it spools it to
+    disk and the file can be linked into place without another pass.
+    """
+
+    def __init__(self, directory):
+        self.file = tempfile.NamedTemporaryFile('w+b', dir=directory, prefix='upload', suffix='.tmp')
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.hash.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def __iter__(self):
+        return iter(self.file)
+
+
+class AssetRequest(Request):
+    """
+    Request class that spools uploaded files into the asset directory
+    instead of an anonymous temporary file.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingFile(ASSET_DIR)
+
+
+def copy_stream(stream, path) -> tuple:
+    """
+    Copies `stream` to a new file at `path` in fixed-size blocks, hashing
+    the data in the same pass. Returns the (size, sha256) of the copy.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'wb') as f:
+        while True:
+            block = stream.read(BLOCK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+            f.write(block)
+            size += len(block)
+    return size, digest.hexdigest()
+
+
+def store_upload(file, path: Path) -> tuple:
+    """
+    Stores an uploaded file at `path` and returns its (size, sha256). Files
+    spooled by `AssetRequest` are hard linked into place, anything else is
+    copied block by block.
+    """
+    stream = file.stream
+    if isinstance(stream, HashingFile):
+        stream.flush()
+        try:
+            os.link(stream.name, path)
+            return stream.size, stream.hash.hexdigest()
+        except OSError:
+            # e.g. the temporary directory is on another file system
+            stream.seek(0)
+
+    return copy_stream(stream, path)
+
+
+def hash_file(path: Path) -> str:
+    """
+    Returns the SHA-256 of the file at `path`, reading it in blocks
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(BLOCK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def streamable(path: Path, length: int, extension: str) -> bool:
+    """
+    Whether a video can be read in order, given its first `length` bytes.
+    Matroska and WebM files can, MP4 and MOV files only if their moov box
+    has arrived and comes before the media data (faststart).
+    """
+    if extension.lower() in ('.mkv', '.webm'):
+        return True
+
+    with open(path, 'rb') as f:
+        offset = 0
+        while offset + 8 <= length:
+            f.seek(offset)
+            size, kind = struct.unpack('>I4s', f.read(8))
+            if size == 1:
+                # 64-bit box size
+                size, = struct.unpack('>Q', f.read(8))
+            if kind == b'moov':
+                return offset + size <= length
+            if kind == b'mdat' or size < 8:
+                return False
+            offset += size
+    return False
+
+
+def open_source(paths):
+    # the upload is renamed when it is finalized, open whichever exists
+    for path in paths:
+        try:
+            return open(path, 'rb')
+        except FileNotFoundError:
+            continue
+    raise FileNotFoundError(paths[-1])
+
+
+def feed_upload(source, fifo: Path, upload_id, size: int, errors: list, stopped: threading.Event) -> None:
+    """
+    Copies the `size` bytes of an upload from `source` into the FIFO, as far
+    as they have been received. Stops when the upload is aborted or no data
+    arrives for UPLOAD_STALL_TIMEOUT, the reader then sees a truncated file,
+    and when `stopped` is set or the reader closed the FIFO. A reader may
+    stop before the end of the file, e.g. at boxes after the media data, it
+    reports its own errors.
+    """
+    try:
+        with source, open_fifo(fifo, stopped) as out:
+            offset = 0
+            waiting_since = time.monotonic()
+            while offset < size and not stopped.is_set():
+                received = upload_received(upload_id)
+                if received is None:
+                    raise RuntimeError(f"Upload {upload_id} was aborted")
+                if received <= offset:
+                    if time.monotonic() - waiting_since > UPLOAD_STALL_TIMEOUT:
+                        raise RuntimeError(f"Upload {upload_id} stalled at {offset} bytes")
+                    time.sleep(UPLOAD_POLL_INTERVAL)
+                    continue
+
+                block = source.read(min(BLOCK_SIZE, received - offset))
+                if not block:
+                    raise RuntimeError(f"Upload {upload_id} is shorter than {size} bytes")
+                out.write(block)
+                offset += len(block)
+                waiting_since = time.monotonic()
+    except BrokenPipeError:
+        pass
+    except Exception as e:
+        errors.append(e)
+
+
+def open_fifo(fifo: Path, stopped: threading.Event):
+    """
+    Opens the FIFO for writing once a reader opened it. Opening does not
+    block, so the feeder can give up when `stopped` is set before the reader
+    ever came.
+    """
+    while True:
+        try:
+            fd = os.open(fifo, os.O_WRONLY | os.O_NONBLOCK)
+            break
+        except OSError as e:
+            # ENXIO: no reader yet
+            if e.errno != errno.ENXIO or stopped.is_set():
+                raise
+            time.sleep(0.1)
+
+    os.set_blocking(fd, True)
+    return open(fd, 'wb')
+
+
+@contextmanager
+def upload_stream(upload_id, paths, size: int):
+    """
+    Yields the path of a FIFO that delivers an upload in progress in order,
+    while its bytes arrive, so ffmpeg can read it like a file. `paths` are the
+    partial and the finalized file of the upload. Raises if the upload was
+    aborted or stalled, even if the reader finished.
+    """
+    fifo_dir = tempfile.mkdtemp(dir=ASSET_DIR, prefix='stream')
+    fifo = Path(fifo_dir, 'source')
+    os.mkfifo(fifo)
+
+    errors = []
+    stopped = threading.Event()
+    feeder = threading.Thread(target=feed_upload, args=(open_source(paths), fifo, upload_id, size, errors, stopped), daemon=True)
+    feeder.start()
+    try:
+        yield fifo
+    finally:
+        # the feeder's writes fail once no reader is left, and it does not
+        # wait for a reader once stopped
+        stopped.set()
+        feeder.join()
+        shutil.rmtree(fifo_dir)
+
+    if errors:
+        raise errors[0]
+
+
+# a dropped download is resumed this many times, seconds without data after
+# which a connection counts as dropped
+DOWNLOAD_ATTEMPTS = 5
+DOWNLOAD_TIMEOUT = 60
+# redirects followed per request, each target is checked like the URL itself
+DOWNLOAD_MAX_REDIRECTS = 5
+
+
+def public_addresses(host: str, port: int) -> list:
+    """
+    Resolves `host` and returns its addresses. Raises ValueError unless
+    every one of them is public, so imports can not reach the services next
+    to the worker (redis, postgres, cloud metadata) or the local network.
+    """
+    try:
+        addresses = socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError):
+        raise ValueError(f"{host} can not be resolved")
+
+    result = []
+    for *_, sockaddr in addresses:
+        address = ipaddress.ip_address(sockaddr[0])
+        if not address.is_global or address.is_multicast:
+            raise ValueError(f"{host} is not a public host")
+        result.append(sockaddr[0])
+    return result
+
+
+def check_public_url(url: str) -> None:
+    """
+    Raises ValueError unless `url` is an HTTP(S) URL of a public host, see
+    `public_addresses`
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        raise ValueError(f"{url} is not an HTTP(S) URL")
+
+    public_addresses(parsed.hostname, parsed.port or (443 if parsed.scheme == 'https' else 80))
+
+
+class PublicConnectionMixin:
+    """
+    Connects to the addresses of the host that were checked by
+    `public_addresses`, resolving the host only once, so it can not resolve
+    to a public address for the check and to a private one for the
+    connection. The Host header and SNI keep the name of the host.
+    """
+
+    def _new_conn(self):
+        extra_kw = {}
+        if self.source_address:
+            extra_kw["source_address"] = self.source_address
+        if self.socket_options:
+            extra_kw["socket_options"] = self.socket_options
+
+        error = None
+        for address in public_addresses(self.host, self.port):
+            try:
+                return create_connection((address, self.port), self.timeout, **extra_kw)
+            except socket.timeout:
+                raise ConnectTimeoutError(self, f"Connection to {self.host} timed out. (connect timeout={self.timeout})")
+            except OSError as e:
+                error = e
+        raise NewConnectionError(self, f"Failed to establish a new connection: {error}")
+
+
+class PublicHTTPConnection(PublicConnectionMixin, HTTPConnection):
+    pass
+
+
+class PublicHTTPSConnection(PublicConnectionMixin, HTTPSConnection):
+    pass
+
+
+class PublicHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = PublicHTTPConnection
+
+
+class PublicHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = PublicHTTPSConnection
+
+
+class PublicAdapter(HTTPAdapter):
+    """
+    Transport adapter that only connects to public hosts
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': PublicHTTPConnectionPool,
+                                                   'https': PublicHTTPSConnectionPool}
+
+
+def public_session() -> requests.Session:
+    session = requests.Session()
+    # a proxy from the environment would be checked instead of the host
+    session.trust_env = False
+    session.mount('http://', PublicAdapter())
+    session.mount('https://', PublicAdapter())
+    return session
+
+
+def get_public(session: requests.Session, url: str, headers: dict):
+    """
+    GET request with a `public_session` that follows redirects only to
+    public hosts. Returns the streamed response.
+    """
+    for _ in range(DOWNLOAD_MAX_REDIRECTS + 1):
+        check_public_url(url)
+        response = session.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT, allow_redirects=False)
+        if not response.is_redirect:
+            return response
+        response.close()
+        url = urljoin(url, response.headers['Location'])
+    raise ValueError(f"{url} redirects more than {DOWNLOAD_MAX_REDIRECTS} times")
+
+
+def response_size(response, offset: int):
+    # total size of the file, None if the server does not say
+    if response.status_code == HTTPStatus.PARTIAL_CONTENT:
+        content_range = parse_content_range(response.headers.get('Content-Range', ''))
+        return content_range[2] if content_range else None
+    length = response.headers.get('Content-Length')
+    return int(length) if length is not None else None
+
+
+def download(url: str, path: Path, max_size: int, sha256: str = None, received=None) -> tuple:
+    """
+    Streams the file at `url` into a new file at `path` in blocks, hashing it
+    in the same pass. A dropped connection is resumed with a Range request,
+    from servers that ignore the range the part that was received already is
+    skipped. Only public hosts are contacted, also when redirected. Fails if
+    the file is larger than `max_size` or does not match the `sha256`
+    checksum, if given. `received` is called with the number of
+    bytes written so far and the total size, None if not known. Returns the
+    (size, sha256) of the file.
+    """
+    digest = hashlib.sha256()
+    offset = 0
+    size = None
+    attempts = 0
+
+    with open(path, 'wb') as f, public_session() as session:
+        while True:
+            headers = {'Accept-Encoding': 'identity'}
+            if offset:
+                headers['Range'] = f'bytes={offset}-'
+            try:
+                with get_public(session, url, headers) as response:
+                    response.raise_for_status()
+                    size = size or response_size(response, offset)
+                    if size is not None and size > max_size:
+                        raise ValueError(f"{url} is larger than {max_size} bytes")
+
+                    skip = offset
+                    if response.status_code == HTTPStatus.PARTIAL_CONTENT:
+                        content_range = parse_content_range(response.headers.get('Content-Range', ''))
+                        if content_range is None or content_range[0] != offset:
+                            raise ValueError(f"{url} returned another range than requested")
+                        skip = 0
+
+                    for block in response.iter_content(BLOCK_SIZE):
+                        if skip:
+                            skipped = min(skip, len(block))
+                            block, skip = block[skipped:], skip - skipped
+                        if not block:
+                            continue
+                        if offset + len(block) > max_size:
+                            raise ValueError(f"{url} is larger than {max_size} bytes")
+                        f.write(block)
+                        digest.update(block)
+                        offset += len(block)
+                        if received is not None:
+                            received(offset, size)
+
+                if size is None or offset >= size:
+                    break
+                raise requests.ConnectionError(f"{url} ended after {offset} of {size} bytes")
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+                attempts += 1
+                if attempts >= DOWNLOAD_ATTEMPTS:
+                    raise
+                time.sleep(2 ** attempts)
+
+    if sha256 is not None and digest.hexdigest() != sha256.lower():
+        raise ValueError(f"{url} does not match its SHA-256 checksum")
+
+    return offset, digest.hexdigest()
@@ -0,0 +1,124 @@
+import os
+import time
+import subprocess
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+
+from app.config import ASSET_DIR, THUMBNAIL_CACHE_SIZE
+
+# widths thumbnails are generated at, requests are rounded up to one of them
+# so the cache holds a few variants per asset
+THUMBNAIL_WIDTHS = (160, 320, 480, 640, 960, 1280)
+
+# mime type and ffmpeg encoder arguments per format
+THUMBNAIL_FORMATS = {
+    "avif": ("image/avif", ('-c:v', 'libaom-av1', '-still-picture', '1', '-crf', '35', '-cpu-used', '6', '-f', 'avif')),
+    "webp": ("image/webp", ('-c:v', 'libwebp', '-quality', '75', '-f', 'webp')),
+    "jpeg": ("image/jpeg", ('-q:v', '4', '-f', 'image2')),
+}
+# ffmpeg encoder and muxer of the formats that not every build has
+OPTIONAL_FORMATS = {
+    "avif": ("libaom-av1", "avif"),
+    "webp": ("libwebp", "webp"),
+}
+
+
+def ffmpeg_names(kind: str) -> set:
+    # names listed by `ffmpeg -encoders` or `ffmpeg -muxers`
+    try:
+        result = subprocess.run(('ffmpeg', '-hide_banner', f'-{kind}'), stdout=subprocess.PIPE, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return set()
+    return {line.split()[1] for line in result.stdout.splitlines() if len(line.split()) > 1}
+
+
+@lru_cache(maxsize=None)
+def supported_formats() -> tuple:
+    """
+    The thumbnail formats the installed ffmpeg can write, probed once per
+    process. JPEG is always supported.
+    """
+    encoders, muxers = ffmpeg_names('encoders'), ffmpeg_names('muxers')
+    return tuple(fmt for fmt in THUMBNAIL_FORMATS
+                 if fmt not in OPTIONAL_FORMATS or (OPTIONAL_FORMATS[fmt][0] in encoders and OPTIONAL_FORMATS[fmt][1] in muxers))
+
+
+def thumbnail_width(width: int) -> int:
+    return next((size for size in THUMBNAIL_WIDTHS if size >= width), THUMBNAIL_WIDTHS[-1])
+
+
+def negotiate_format(accept) -> str:
+    """
+    Picks the smallest supported format the client accepts, `accept` being
+    the parsed Accept header of the request
+    """
+    for fmt in ("avif", "webp"):
+        if fmt in supported_formats() and THUMBNAIL_FORMATS[fmt][0] in accept.values():
+            return fmt
+    return "jpeg"
+
+
+def cached_thumbnail(asset, width: int, fmt: str) -> Path:
+    """
+    Returns the path of the `width` pixels wide thumbnail of the asset in
+    format `fmt`, generating it from the source video on first use. The
+    access time of cached files is updated on every use, so eviction can
+    drop the least recently used variants.
+    """
+    cache_dir = Path(ASSET_DIR, 'thumbnails')
+    path = Path(cache_dir, f'{asset.id}-{width}.{fmt}')
+
+    if path.exists():
+        os.utime(path, (time.time(), path.stat().st_mtime))
+        return path
+
+    cache_dir.mkdir(exist_ok=True)
+    render_thumbnail(asset, path, width, fmt)
+    evict(cache_dir, THUMBNAIL_CACHE_SIZE)
+    return path
+
+
+def render_thumbnail(asset, path: Path, width: int, fmt: str) -> None:
+    """
+    Renders the thumbnail frame of the asset at `width`. The frame is taken
+    from the source video when it is still around, otherwise the stored
+    thumbnail is scaled.
+    """
+    source_path = Path(ASSET_DIR, asset.source_path) if asset.source_path else None
+    if source_path is not None and source_path.exists() and asset.duration:
+        # same frame as create_thumbnail
+        inp = ('-ss', str(min(1, asset.duration / 2)), '-i', source_path.as_posix())
+    else:
+        inp = ('-i', Path(ASSET_DIR, asset.thumbnail_path).as_posix())
+
+    # write next to the cache entry and move it in place, so concurrent
+    # requests never serve a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    os.close(fd)
+    try:
+        subprocess.check_call(('ffmpeg', '-hide_banner', '-loglevel', 'error', '-y') + inp + (
+                               '-frames:v', '1',
+                               '-vf', f'scale={width}:-2') + THUMBNAIL_FORMATS[fmt][1] + (tmp_path,))
+        os.replace(tmp_path, path)
+    finally:
+        Path(tmp_path).unlink(missing_ok=True)
+
+
+def evict(directory: Path, max_size: int) -> None:
+    """
+    Removes the least recently used files until the directory holds at most
+    `max_size` bytes
+    """
+    entries = []
+    for entry in os.scandir(directory):
+        if entry.is_file() and not entry.name.endswith('.tmp'):
+            stat = entry.stat()
+            entries.append((stat.st_atime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry_path in sorted(entries):
+        if total <= max_size:
+            break
+        Path(entry_path).unlink(missing_ok=True)
+        total -= size
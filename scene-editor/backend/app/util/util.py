@@ -2,6 +2,9 @@ import datetime
 import binascii
 import os
 
+# size of the blocks in which request bodies are copied to disk
+BLOCK_SIZE = 1024 * 1024
+
 def random_file_name() -> str:
     # create random filename
     basename = "asset"
@@ -9,19 +12,66 @@ def random_file_name() -> str:
     random = binascii.b2a_hex(os.urandom(8)).decode()
     return ''.join([basename, prefix, random])
 
-def write_file(request, path, file) -> None:
-    # save the file to system and create the database entry
-    # check if file upload is chunked
-    if 'Content-Range' in request.headers:
-        # extract starting byte from Content-Range header string
-        range_str = request.headers['Content-Range']
-        start_bytes = int(range_str.split(' ')[1].split('-')[0])
-
-        # append chunk to the file on disk, or create new
-        with open(path, 'ab') as f:
-            f.seek(start_bytes)
-            f.write(file.stream.read())
-
-    else:
-        with open(path, 'ab') as f:
-            f.write(file.stream.read())
+def parse_content_range(range_str):
+    """
+    Parses a `bytes <start>-<end>/<total>` Content-Range header value into a
+    (start, end, total) tuple, where `end` is exclusive. Returns None if the
+    header is malformed.
+    """
+    try:
+        unit, spec = range_str.strip().split(' ', 1)
+        byte_range, total = spec.split('/')
+        start, end = byte_range.split('-')
+        start, end, total = int(start), int(end) + 1, int(total)
+    except ValueError:
+        return None
+
+    if unit != 'bytes' or start < 0 or end <= start or end > total:
+        return None
+
+    return start, end, total
+
+def add_range(ranges, start, end):
+    """
+    Adds the half-open byte range [start, end) to a list of received ranges,
+    merging overlapping and adjacent ranges. Returns a new sorted list.
+    """
+    merged = []
+    for range_start, range_end in sorted([*ranges, [start, end]]):
+        if merged and range_start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], range_end)
+        else:
+            merged.append([range_start, range_end])
+    return merged
+
+def missing_ranges(ranges, size):
+    """
+    Returns the half-open byte ranges of a file of `size` bytes that are not
+    covered by the received ranges.
+    """
+    missing = []
+    offset = 0
+    for start, end in ranges:
+        if start > offset:
+            missing.append([offset, start])
+        offset = max(offset, end)
+    if offset < size:
+        missing.append([offset, size])
+    return missing
+
+def write_chunk(stream, path, offset, length) -> int:
+    """
+    Writes `length` bytes from `stream` into the existing file at `path`,
+    starting at `offset`. The body is copied in blocks, so that memory usage
+    does not depend on the chunk size. Returns the number of bytes written.
+    """
+    written = 0
+    with open(path, 'r+b') as f:
+        f.seek(offset)
+        while written < length:
+            block = stream.read(min(BLOCK_SIZE, length - written))
+            if not block:
+                break
+            f.write(block)
+            written += len(block)
+    return written
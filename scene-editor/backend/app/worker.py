@@ -8,7 +8,8 @@ from rq import Worker, Queue, Connection
 # see: https://stackoverflow.com/questions/52164846/flask-redis-queue-rq-worker-cannot-import-module-named-app
 sys.path.insert(0, '/app')
 
-listen = os.getenv('QUEUES', 'default').split(',')
+# interactive jobs are taken before downloads and bulk transcodes
+listen = os.getenv('QUEUES', 'interactive,import,bulk').split(',')
 
 redis_url = os.getenv('REDIS_URL', 'redis://localhost:6379')
 conn = redis.from_url(redis_url)
@@ -16,4 +17,5 @@ conn = redis.from_url(redis_url)
 if __name__ == '__main__':
     with Connection(conn):
         worker = Worker(list(map(Queue, listen)))
-        worker.work()
\ No newline at end of file
+        # the scheduler enqueues delayed jobs, e.g. removing replaced streams
+        worker.work(with_scheduler=True)
\ No newline at end of file
@@ -0,0 +1,115 @@
+"""
+Measures the CPU time of the HLS transcode on synthetic 4K input.
+
+Run from the backend directory (ffmpeg and ffprobe have to be installed):
+
+    python -m benchmarks.transcode --seconds 60
+
+Reports the CPU seconds (user + system of the ffmpeg processes) spent per
+minute of input, for the previous graph that scales every rendition from
+the source and encodes the audio per rendition, for `create_hls` (single
+pass, the default path of `process_video`) and for `create_hls_progressive`
+(used when HLS_PROGRESSIVE is set).
+
+With --codecs, e.g. `--codecs h264,hevc,av1`, the ladder is also encoded
+as CMAF with each codec on its own, reporting the CPU seconds and the size
+of the stream per codec.
+"""
+import argparse
+import resource
+import subprocess
+import tempfile
+from pathlib import Path
+
+from app.util.ffmpeg import HLS_PROFILES, VIDEO_CODECS, x264_args, add_codecs, create_hls, create_hls_progressive
+
+
+def create_input(path: Path, seconds: int, width: int, height: int) -> None:
+    subprocess.check_call(('ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+                           '-f', 'lavfi', '-i', f'testsrc2=size={width}x{height}:rate=30',
+                           '-f', 'lavfi', '-i', 'sine=frequency=440:sample_rate=48000',
+                           '-t', str(seconds),
+                           '-c:v', 'libx264', '-preset', 'ultrafast', '-crf', '18',
+                           '-c:a', 'aac',
+                           path.as_posix()))
+
+
+def create_hls_per_rendition(inp_path: Path, output_dir: Path) -> None:
+    """
+    The graph before the scale cascade: every rendition maps and scales the
+    source and encodes its own copy of the audio
+    """
+    args = ('ffmpeg', '-hide_banner', '-loglevel', 'error',
+            '-i', inp_path.as_posix()) + x264_args(HLS_PROFILES)
+
+    var_stream_map = []
+    for i, prof in enumerate(HLS_PROFILES):
+        args += ('-map', '0:v:0', '-map', '0:a:0',
+                 f'-filter:v:{i}', f'scale={prof.width}:{prof.height}:force_original_aspect_ratio=decrease',
+                 f'-c:v:{i}', 'libx264',
+                 f'-b:v:{i}', f'{prof.video_bitrate}k',
+                 f'-c:a:{i}', 'aac',
+                 f'-b:a:{i}', f'{prof.audio_bitrate}k')
+        var_stream_map.append(f"v:{i},a:{i}")
+
+    args += ('-var_stream_map', ' '.join(var_stream_map),
+             '-f', 'hls',
+             '-hls_time', '6',
+             '-hls_list_size', '0',
+             '-hls_playlist_type', 'vod',
+             '-master_pl_name', 'main.m3u8',
+             '-hls_segment_filename', f'{output_dir}/v%v-s%d.ts', f'{output_dir}/v%v.m3u8')
+    subprocess.check_call(args)
+
+
+def cpu_seconds(fn, *args) -> float:
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    fn(*args)
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+
+
+def create_hls_codec(inp_path: Path, output_dir: Path, codec: str) -> None:
+    create_hls(inp_path, output_dir, add_codecs(HLS_PROFILES, [codec]), segment_type="fmp4")
+
+
+def create_hls_lowest_first(inp_path: Path, output_dir: Path, seconds: int) -> None:
+    # lowest rendition and audio first, then the others, at planned boundaries
+    create_hls_progressive(inp_path, output_dir, HLS_PROFILES, {"duration": seconds})
+
+
+def directory_size(path: Path) -> int:
+    return sum(entry.stat().st_size for entry in path.iterdir() if entry.is_file())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=int, default=60, help="duration of the synthetic input")
+    parser.add_argument('--width', type=int, default=3840)
+    parser.add_argument('--height', type=int, default=2160)
+    parser.add_argument('--codecs', default='', help=f"comma separated codecs to compare, of {', '.join(VIDEO_CODECS)}")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        inp_path = Path(work_dir, 'input.mp4')
+        create_input(inp_path, args.seconds, args.width, args.height)
+
+        runs = (('per rendition', create_hls_per_rendition, ()),
+                ('cascade', create_hls, ()),
+                ('progressive', create_hls_lowest_first, (args.seconds,)))
+        for name, fn, extra in runs:
+            output_dir = Path(work_dir, name.replace(' ', '-'))
+            output_dir.mkdir()
+            seconds = cpu_seconds(fn, inp_path, output_dir, *extra)
+            print(f'{name:>16}: {seconds:8.1f} CPU s, {seconds / args.seconds * 60:8.1f} CPU s per minute of input')
+
+        for codec in filter(None, args.codecs.split(',')):
+            output_dir = Path(work_dir, codec)
+            output_dir.mkdir()
+            seconds = cpu_seconds(create_hls_codec, inp_path, output_dir, codec)
+            size = directory_size(output_dir) / 1024 ** 2
+            print(f'{codec:>16}: {seconds:8.1f} CPU s, {seconds / args.seconds * 60:8.1f} CPU s per minute of input, {size:8.1f} MiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""add upload table
+
+Revision ID: 3c5e1f0a9b27
+Revises: 12158b7272f5
+Create Date: 2026-10-17 10:12:40.512311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID
+
+
+# revision identifiers, used by Alembic.
+revision = '3c5e1f0a9b27'
+down_revision = '12158b7272f5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('upload',
+    sa.Column('id', UUID(), nullable=False),
+    sa.Column('user_id', UUID(), nullable=False),
+    sa.Column('project_id', UUID(), nullable=False),
+    sa.Column('name', sa.String(length=128), nullable=True),
+    sa.Column('file_name', sa.String(length=128), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('received', sa.JSON(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['project_id'], ['project.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('upload')
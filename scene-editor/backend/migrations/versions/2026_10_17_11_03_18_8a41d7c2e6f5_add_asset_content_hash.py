@@ -0,0 +1,24 @@
+"""add asset content hash
+
+Revision ID: 8a41d7c2e6f5
+Revises: 3c5e1f0a9b27
+Create Date: 2026-10-17 11:03:18.220417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a41d7c2e6f5'
+down_revision = '3c5e1f0a9b27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('asset', sa.Column('content_hash', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    op.drop_column('asset', 'content_hash')
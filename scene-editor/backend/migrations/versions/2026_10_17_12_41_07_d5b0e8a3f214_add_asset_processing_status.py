@@ -0,0 +1,37 @@
+"""add asset processing status
+
+Revision ID: d5b0e8a3f214
+Revises: 8a41d7c2e6f5
+Create Date: 2026-10-17 12:41:07.903581
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5b0e8a3f214'
+down_revision = '8a41d7c2e6f5'
+branch_labels = None
+depends_on = None
+
+asset_status = sa.Enum('processing', 'ready', 'failed', name='asset_status')
+
+
+def upgrade():
+    asset_status.create(op.get_bind(), checkfirst=True)
+    # existing assets were transcoded during the upload request
+    op.add_column('asset', sa.Column('status', asset_status, nullable=False, server_default='ready'))
+    op.add_column('asset', sa.Column('job_id', sa.String(length=64), nullable=True))
+    op.add_column('asset', sa.Column('source_path', sa.String(length=128), nullable=True))
+
+    # uploads were stored next to their HLS directory as <base name>.mp4
+    op.execute("UPDATE asset SET source_path = split_part(path, '/', 1) || '.mp4' "
+               "WHERE asset_type = 'video' AND path LIKE '%/main.m3u8'")
+
+
+def downgrade():
+    op.drop_column('asset', 'source_path')
+    op.drop_column('asset', 'job_id')
+    op.drop_column('asset', 'status')
+    asset_status.drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,24 @@
+"""add asset renditions
+
+Revision ID: 6e9c4b17a0d3
+Revises: d5b0e8a3f214
+Create Date: 2026-10-17 14:20:52.108734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e9c4b17a0d3'
+down_revision = 'd5b0e8a3f214'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('asset', sa.Column('renditions', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('asset', 'renditions')
@@ -0,0 +1,24 @@
+"""add asset media info
+
+Revision ID: b73f02d9c5e1
+Revises: 6e9c4b17a0d3
+Create Date: 2026-10-17 15:02:33.640192
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b73f02d9c5e1'
+down_revision = '6e9c4b17a0d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('asset', sa.Column('media_info', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('asset', 'media_info')
@@ -0,0 +1,24 @@
+"""add asset dash path
+
+Revision ID: f27a9c6d1e48
+Revises: b73f02d9c5e1
+Create Date: 2026-10-17 15:40:11.284715
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f27a9c6d1e48'
+down_revision = 'b73f02d9c5e1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('asset', sa.Column('dash_path', sa.String(length=128), nullable=True))
+
+
+def downgrade():
+    op.drop_column('asset', 'dash_path')
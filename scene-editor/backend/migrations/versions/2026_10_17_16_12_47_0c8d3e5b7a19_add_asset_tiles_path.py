@@ -0,0 +1,24 @@
+"""add asset tiles path
+
+Revision ID: 0c8d3e5b7a19
+Revises: f27a9c6d1e48
+Create Date: 2026-10-17 16:12:47.517304
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0c8d3e5b7a19'
+down_revision = 'f27a9c6d1e48'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('asset', sa.Column('tiles_path', sa.String(length=128), nullable=True))
+
+
+def downgrade():
+    op.drop_column('asset', 'tiles_path')
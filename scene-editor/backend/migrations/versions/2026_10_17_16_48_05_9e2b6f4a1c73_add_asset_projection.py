@@ -0,0 +1,31 @@
+"""add asset projection
+
+Revision ID: 9e2b6f4a1c73
+Revises: 0c8d3e5b7a19
+Create Date: 2026-10-17 16:48:05.102938
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e2b6f4a1c73'
+down_revision = '0c8d3e5b7a19'
+branch_labels = None
+depends_on = None
+
+projection = sa.Enum('equirectangular', 'cubemap', 'eac', name='projection')
+
+
+def upgrade():
+    projection.create(op.get_bind(), checkfirst=True)
+    # all existing streams are equirectangular
+    op.add_column('asset', sa.Column('projection', projection, nullable=False, server_default='equirectangular'))
+    op.add_column('upload', sa.Column('projection', sa.String(length=32), nullable=True))
+
+
+def downgrade():
+    op.drop_column('upload', 'projection')
+    op.drop_column('asset', 'projection')
+    projection.drop(op.get_bind(), checkfirst=True)
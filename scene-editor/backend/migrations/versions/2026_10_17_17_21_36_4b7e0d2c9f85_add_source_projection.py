@@ -0,0 +1,28 @@
+"""add source projection
+
+Revision ID: 4b7e0d2c9f85
+Revises: 9e2b6f4a1c73
+Create Date: 2026-10-17 17:21:36.845120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b7e0d2c9f85'
+down_revision = '9e2b6f4a1c73'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('asset', sa.Column('source_projection', sa.String(length=32), nullable=True))
+    # existing videos were transcoded from equirectangular sources as they were
+    op.execute("UPDATE asset SET source_projection = 'equirectangular' WHERE asset_type = 'video'")
+    op.add_column('upload', sa.Column('source_projection', sa.String(length=32), nullable=True))
+
+
+def downgrade():
+    op.drop_column('upload', 'source_projection')
+    op.drop_column('asset', 'source_projection')
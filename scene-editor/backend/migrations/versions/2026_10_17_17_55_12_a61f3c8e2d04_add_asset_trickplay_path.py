@@ -0,0 +1,24 @@
+"""add asset trickplay path
+
+Revision ID: a61f3c8e2d04
+Revises: 4b7e0d2c9f85
+Create Date: 2026-10-17 17:55:12.390671
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a61f3c8e2d04'
+down_revision = '4b7e0d2c9f85'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('asset', sa.Column('trickplay_path', sa.String(length=128), nullable=True))
+
+
+def downgrade():
+    op.drop_column('asset', 'trickplay_path')
@@ -0,0 +1,24 @@
+"""add asset cue points
+
+Revision ID: c3d8a1f5b6e2
+Revises: a61f3c8e2d04
+Create Date: 2026-10-17 18:34:50.771263
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3d8a1f5b6e2'
+down_revision = 'a61f3c8e2d04'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('asset', sa.Column('cue_points', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('asset', 'cue_points')
@@ -0,0 +1,27 @@
+"""add upload asset id
+
+Revision ID: 5d9a2c7e4b10
+Revises: c3d8a1f5b6e2
+Create Date: 2026-10-17 19:12:05.214870
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID
+
+
+# revision identifiers, used by Alembic.
+revision = '5d9a2c7e4b10'
+down_revision = 'c3d8a1f5b6e2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('upload', sa.Column('asset_id', UUID(), nullable=True))
+    op.create_foreign_key('upload_asset_id_fkey', 'upload', 'asset', ['asset_id'], ['id'], ondelete='SET NULL')
+
+
+def downgrade():
+    op.drop_constraint('upload_asset_id_fkey', 'upload', type_='foreignkey')
+    op.drop_column('upload', 'asset_id')
@@ -0,0 +1,23 @@
+"""add asset content hash index
+
+Revision ID: 8f1c6b3a0d27
+Revises: 5d9a2c7e4b10
+Create Date: 2026-10-17 19:48:31.602915
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8f1c6b3a0d27'
+down_revision = '5d9a2c7e4b10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_asset_content_hash'), 'asset', ['content_hash'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_asset_content_hash'), table_name='asset')
@@ -0,0 +1,25 @@
+"""make asset file size big integer
+
+Revision ID: e4a7c2b91f36
+Revises: 8f1c6b3a0d27
+Create Date: 2026-10-18 09:14:22.318407
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a7c2b91f36'
+down_revision = '8f1c6b3a0d27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # uploads can be larger than 2 GiB
+    op.alter_column('asset', 'file_size', type_=sa.BigInteger(), existing_type=sa.Integer(), existing_nullable=True)
+
+
+def downgrade():
+    op.alter_column('asset', 'file_size', type_=sa.Integer(), existing_type=sa.BigInteger(), existing_nullable=True)
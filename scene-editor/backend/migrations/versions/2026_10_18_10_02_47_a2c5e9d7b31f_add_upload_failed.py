@@ -0,0 +1,24 @@
+"""add upload failed
+
+Revision ID: a2c5e9d7b31f
+Revises: e4a7c2b91f36
+Create Date: 2026-10-18 10:02:47.106532
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a2c5e9d7b31f'
+down_revision = 'e4a7c2b91f36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('upload', sa.Column('failed', sa.Boolean(), nullable=False, server_default=sa.false()))
+
+
+def downgrade():
+    op.drop_column('upload', 'failed')
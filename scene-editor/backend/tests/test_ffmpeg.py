@@ -0,0 +1,162 @@
+import json
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from app.util.ffmpeg import HlsProfile, HLS_PROFILES, segment_boundaries, select_ladder, select_stereo_ladder, playlist_boundaries, tile_grid, tile_manifest, create_hls, create_tiles, encode_renditions
+
+needs_ffmpeg = pytest.mark.skipif(shutil.which('ffmpeg') is None, reason="ffmpeg is not installed")
+
+
+def test_segment_boundaries_regular():
+    assert segment_boundaries(20, []) == [0.0, 5.0, 10.0, 15.0]
+
+
+def test_segment_boundaries_cue_point():
+    # a cue point starts a short segment, the rest is cut evenly
+    assert segment_boundaries(20, [9.5]) == [0.0, 4.75, 9.5, 11.5, 15.75]
+
+
+def test_segment_boundaries_ignores_cue_points_outside_the_video():
+    assert segment_boundaries(20, [0, 25]) == segment_boundaries(20, [])
+
+
+def test_segment_boundaries_cue_point_near_the_end():
+    assert segment_boundaries(20, [19])[-1] == 19.0
+
+
+def test_segment_boundaries_initial_segments():
+    boundaries = segment_boundaries(20, [], initial=(1, 2))
+    assert boundaries[:3] == [0.0, 1.0, 3.0]
+    assert all(b - a <= 6 for a, b in zip(boundaries, boundaries[1:] + [20]))
+
+
+def test_select_ladder_clamps_the_smallest_upscaled_profile():
+    ladder = select_ladder(HLS_PROFILES, 1920, 960)
+    assert [(prof.width, prof.height, prof.video_bitrate) for prof in ladder] == [(1920, 960, 6000), (1280, 640, 3000), (960, 480, 2000)]
+
+
+def test_select_ladder_caps_bitrates_at_the_source():
+    ladder = select_ladder(HLS_PROFILES, 1920, 960, bitrate=2500)
+    assert [prof.video_bitrate for prof in ladder] == [2500, 2500, 2000]
+
+
+def test_select_ladder_small_source():
+    ladder = select_ladder(HLS_PROFILES, 641, 321)
+    assert [(prof.width, prof.height) for prof in ladder] == [(640, 320)]
+
+
+def test_select_stereo_ladder_mono_is_select_ladder():
+    assert select_stereo_ladder(HLS_PROFILES, 1920, 960, "mono") == select_ladder(HLS_PROFILES, 1920, 960)
+
+
+def test_select_stereo_ladder_top_bottom():
+    ladder = select_stereo_ladder(HLS_PROFILES, 3840, 3840, "top_bottom")
+    top = ladder[0]
+    # every eye gets the pixels of the profile, so the 4K profile keeps the source
+    assert (top.width, top.height, top.video_bitrate) == (3840, 3840, 32000)
+    for prof in ladder:
+        assert prof.width == prof.height
+        assert prof.width % 2 == 0
+    assert [prof.width for prof in ladder] == sorted((prof.width for prof in ladder), reverse=True)
+
+
+def test_select_stereo_ladder_side_by_side():
+    ladder = select_stereo_ladder(HLS_PROFILES, 3840, 960, "side_by_side", bitrate=20000)
+    for prof in ladder:
+        assert prof.width == prof.height * 4
+        assert prof.video_bitrate <= 20000
+
+
+def test_playlist_boundaries(tmp_path):
+    playlist = Path(tmp_path, 'v0.m3u8')
+    playlist.write_text('#EXTM3U\n#EXT-X-TARGETDURATION:6\n'
+                        '#EXTINF:4.000000,\nv0-s0.ts\n'
+                        '#EXTINF:2.000000,\nv0-s1.ts\n'
+                        '#EXTINF:6.000000,\nv0-s2.ts\n'
+                        '#EXT-X-ENDLIST\n')
+    assert playlist_boundaries(playlist) == pytest.approx([0.0, 3.999, 5.999])
+
+
+def test_tile_grid_covers_the_frame():
+    grid = tile_grid(1280, 640, 4, 2)
+    assert len(grid) == 8
+    assert sum(w * h for _, _, w, h in grid) == 1280 * 640
+    assert all(x % 2 == 0 and y % 2 == 0 and w % 2 == 0 and h % 2 == 0 for x, y, w, h in grid)
+
+
+def test_tile_manifest():
+    profiles = [HlsProfile(1280, 640, 3000, 128), HlsProfile(640, 320, 1000, 96)]
+    manifest = tile_manifest(profiles, 4, 2)
+    assert len(manifest["tiles"]) == 8
+    first = manifest["tiles"][0]
+    assert first["yaw"] == [-180, -90]
+    assert first["pitch"] == [0, 90]
+    assert [quality["playlist"] for quality in first["qualities"]] == ["t0q0.m3u8", "t0q1.m3u8"]
+    # the bitrate of a rendition is shared by its tiles
+    assert sum(tile["qualities"][0]["video_bitrate"] for tile in manifest["tiles"]) == pytest.approx(3000, abs=8)
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = Path(tmp_path, 'source.mp4')
+    subprocess.check_call(('ffmpeg', '-hide_banner', '-loglevel', 'error',
+                           '-f', 'lavfi', '-i', 'testsrc2=size=640x320:rate=25',
+                           '-f', 'lavfi', '-i', 'sine=frequency=440:sample_rate=48000',
+                           '-t', '8', '-c:v', 'libx264', '-preset', 'ultrafast', '-c:a', 'aac',
+                           path.as_posix()))
+    return path
+
+
+LADDER = [HlsProfile(640, 320, 800, 96), HlsProfile(320, 160, 300, 64)]
+
+
+@needs_ffmpeg
+def test_create_hls(source, tmp_path):
+    output_dir = Path(tmp_path, 'hls')
+    output_dir.mkdir()
+    create_hls(source, output_dir, LADDER, {"duration": 8})
+
+    master = Path(output_dir, 'main.m3u8').read_text()
+    assert 'RESOLUTION=640x320' in master and 'RESOLUTION=320x160' in master
+    assert 'URI="vaudio.m3u8"' in master
+    assert playlist_boundaries(Path(output_dir, 'v0.m3u8')) == playlist_boundaries(Path(output_dir, 'v1.m3u8'))
+
+
+@needs_ffmpeg
+def test_create_hls_at_planned_boundaries(source, tmp_path):
+    output_dir = Path(tmp_path, 'hls')
+    output_dir.mkdir()
+    boundaries = segment_boundaries(8, [3])
+    create_hls(source, output_dir, LADDER, {"duration": 8}, boundaries=boundaries)
+
+    for playlist in ('v0.m3u8', 'v1.m3u8'):
+        # keyframes fall on the first frame at or after a boundary
+        assert playlist_boundaries(Path(output_dir, playlist)) == pytest.approx(boundaries, abs=0.05)
+
+
+@needs_ffmpeg
+def test_encode_renditions_line_up(source, tmp_path):
+    output_dir = Path(tmp_path, 'hls')
+    output_dir.mkdir()
+    boundaries = segment_boundaries(8, [3])
+    encode_renditions(source, output_dir, LADDER, [1], {"duration": 8}, boundaries=boundaries)
+    encode_renditions(source, output_dir, LADDER, [0], {"duration": 8}, boundaries=playlist_boundaries(Path(output_dir, 'v1.m3u8')), audio=False)
+
+    assert playlist_boundaries(Path(output_dir, 'v0.m3u8')) == pytest.approx(playlist_boundaries(Path(output_dir, 'v1.m3u8')), abs=0.05)
+
+
+@needs_ffmpeg
+def test_create_tiles(source, tmp_path):
+    output_dir = Path(tmp_path, 'tiles')
+    output_dir.mkdir()
+    create_tiles(source, output_dir, 2, 2, LADDER, {"duration": 8})
+
+    manifest = json.loads(Path(output_dir, 'tiles.json').read_text())
+    assert len(manifest["tiles"]) == 4
+    for tile in manifest["tiles"]:
+        for quality in tile["qualities"]:
+            assert Path(output_dir, quality["playlist"]).exists()
+    assert Path(output_dir, 'audio.m3u8').exists()
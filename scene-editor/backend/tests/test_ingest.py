@@ -0,0 +1,43 @@
+from types import SimpleNamespace
+
+from app.models.asset import Projection, ViewType
+from app.util.ffmpeg import HlsProfile
+from app.util.ingest import ladder_diff, ladder_to_renditions, rendition_key, target_ladder
+
+
+def video(width, height, renditions=None):
+    media = {"width": width, "height": height, "video_bitrate": None}
+    return SimpleNamespace(media_info=media, projection=Projection.equirectangular, source_projection="equirectangular",
+                           view_type=ViewType.mono, renditions=renditions)
+
+
+def test_ladder_diff_up_to_date():
+    asset = video(1920, 960)
+    asset.renditions = ladder_to_renditions(target_ladder(asset))
+    _, missing, removed = ladder_diff(asset)
+    assert missing == [] and removed == []
+
+
+def test_ladder_diff_missing_and_removed():
+    asset = video(1920, 960)
+    ladder = target_ladder(asset)
+    # the lowest rung is missing, a rung that is no longer configured is there
+    asset.renditions = ladder_to_renditions(ladder[:-1] + [HlsProfile(640, 320, 1000, 96)])
+    configured, missing, removed = ladder_diff(asset)
+    assert configured == ladder
+    assert [rendition_key(prof) for prof in missing] == [rendition_key(ladder[-1])]
+    assert removed == [len(ladder) - 1]
+
+
+def test_ladder_diff_ignores_bitrates():
+    asset = video(1920, 960)
+    ladder = target_ladder(asset)
+    asset.renditions = ladder_to_renditions([HlsProfile(prof.width, prof.height, prof.video_bitrate // 2, prof.audio_bitrate) for prof in ladder])
+    _, missing, removed = ladder_diff(asset)
+    assert missing == [] and removed == []
+
+
+def test_ladder_diff_video_without_renditions():
+    asset = video(1920, 960)
+    ladder, missing, removed = ladder_diff(asset)
+    assert missing == ladder and removed == []
@@ -0,0 +1,41 @@
+import struct
+from pathlib import Path
+
+from app.util.stream import streamable
+
+
+def box(kind: bytes, payload: bytes = b'') -> bytes:
+    return struct.pack('>I4s', 8 + len(payload), kind) + payload
+
+
+def write(tmp_path, data: bytes) -> Path:
+    path = Path(tmp_path, 'video.mp4')
+    path.write_bytes(data)
+    return path
+
+
+def test_matroska_is_streamable(tmp_path):
+    path = write(tmp_path, b'\x1a\x45\xdf\xa3')
+    assert streamable(path, 4, '.mkv')
+    assert streamable(path, 4, '.WEBM')
+
+
+def test_faststart_mp4_is_streamable(tmp_path):
+    data = box(b'ftyp', b'isom') + box(b'moov', b'\0' * 100) + box(b'mdat', b'\0' * 1000)
+    assert streamable(write(tmp_path, data), len(data), '.mp4')
+
+
+def test_mp4_before_its_moov_arrived(tmp_path):
+    data = box(b'ftyp', b'isom') + box(b'moov', b'\0' * 100) + box(b'mdat', b'\0' * 1000)
+    assert not streamable(write(tmp_path, data), 50, '.mp4')
+
+
+def test_mp4_with_moov_at_the_end(tmp_path):
+    data = box(b'ftyp', b'isom') + box(b'mdat', b'\0' * 1000) + box(b'moov', b'\0' * 100)
+    assert not streamable(write(tmp_path, data), len(data), '.mov')
+
+
+def test_mp4_with_64_bit_box_size(tmp_path):
+    large_free = struct.pack('>I4sQ', 1, b'free', 16 + 4) + b'\0' * 4
+    data = box(b'ftyp', b'isom') + large_free + box(b'moov', b'\0' * 10)
+    assert streamable(write(tmp_path, data), len(data), '.mp4')
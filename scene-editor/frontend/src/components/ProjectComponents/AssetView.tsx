@@ -177,7 +177,7 @@ const useStyles = makeStyles((theme) =>
   };
 
   const deleteCheckedAssets = () => {
-    Promise.all(checked.map((id:any) => axios.post(`/api/asset/${id}/delete`)))
+    Promise.all(checked.map((id:any) => axios.post(`/api/asset/${id}/delete`, null, {params: {project_id: activeProject}})))
       .then(() => setChecked([]))
       .then(fetchAssets)
       .then(() => setAlertMessage({show: true, message: "Asset(s) successfully deleted", type: Alert.Success}))